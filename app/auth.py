@@ -2,6 +2,10 @@ import bcrypt
 
 MAX_PASSWORD_LENGTH = 72
 
+# Stored in place of a password hash for users who log in through Supabase.
+# It is not a valid bcrypt hash, so verify_password() can never match it.
+EXTERNAL_AUTH_MARKER = "!external-auth"
+
 
 def hash_password(password: str) -> str:
     # bcrypt limit: max 72 bytes
@@ -10,5 +14,7 @@ def hash_password(password: str) -> str:
 
 
 def verify_password(password: str, hashed: str) -> bool:
+    if not hashed or hashed == EXTERNAL_AUTH_MARKER:
+        return False
     pwd_bytes = password.encode("utf-8")[:MAX_PASSWORD_LENGTH]
     return bcrypt.checkpw(pwd_bytes, hashed.encode("utf-8"))
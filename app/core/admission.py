@@ -0,0 +1,201 @@
+"""
+Admission control for LLM-bound requests.
+
+- chat_rate_limiter: per-user token bucket, checked when a /chat request arrives.
+- llm_queue: at most LLM_MAX_CONCURRENT LLM calls in flight, and at most
+  LLM_MAX_IN_FLIGHT_PER_USER of them for one user; the rest wait in a bounded
+  queue that is served round-robin across users, so one busy user cannot take
+  every slot (or every threadpool thread) from the others.
+
+Waiters block a threadpool thread (the LLM clients are synchronous), so the
+queue is kept well below the threadpool size: requests that do not call the
+LLM must still find a free thread while the queue is full.
+
+Both raise AdmissionRejected when full; app/main.py turns that into a fast
+429 response with a Retry-After header.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Hashable
+
+RATE_LIMIT_PER_MINUTE = float(os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", "20"))
+RATE_LIMIT_BURST = float(os.getenv("CHAT_RATE_LIMIT_BURST", "5"))
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "8"))
+LLM_MAX_IN_FLIGHT_PER_USER = int(os.getenv("LLM_MAX_IN_FLIGHT_PER_USER", "2"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "16"))
+LLM_QUEUE_PER_USER = int(os.getenv("LLM_QUEUE_PER_USER", "2"))
+# Threads the sync endpoints run on (applied to anyio's default limiter at startup
+# by apply_threadpool_size), and how many of them to keep for requests that never
+# touch the LLM
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+THREADPOOL_RESERVE = int(os.getenv("THREADPOOL_RESERVE", "12"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "15"))
+
+
+def apply_threadpool_size():
+    """Size the threadpool the queue bound below assumes. Call from the running event loop."""
+    import anyio.to_thread
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets; buckets for idle keys are evicted LRU-style."""
+
+    def __init__(self, rate_per_second: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: Hashable):
+        """Take one token for `key`, or raise AdmissionRejected."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+            if tokens < 1:
+                bucket[0] = tokens
+                raise AdmissionRejected((1 - tokens) / self.rate, "Rate limit exceeded")
+            bucket[0] = tokens - 1
+
+
+class FairQueue:
+    """Bounded, per-user round-robin queue in front of a fixed number of slots."""
+
+    def __init__(self, max_concurrent: int, max_queued: int, max_queued_per_user: int, timeout: float,
+                 max_in_flight_per_user: int = LLM_MAX_IN_FLIGHT_PER_USER):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.max_in_flight_per_user = max(1, max_in_flight_per_user)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._in_flight_by_user: Dict[Hashable, int] = {}
+        self._waiting: Dict[Hashable, Deque[object]] = {}
+        self._turns: Deque[Hashable] = deque()  # Users with waiters, in round-robin order
+        self._queued = 0
+        self._granted = set()
+        self._avg_service = 2.0  # Seconds per call (EWMA), used for Retry-After
+
+    def _retry_after(self) -> float:
+        return self._avg_service * (self._queued + 1) / max(1, self.max_concurrent)
+
+    @contextmanager
+    def slot(self, user_id: Hashable):
+        self._acquire(user_id)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(user_id, time.monotonic() - start)
+
+    def _start(self, user_id: Hashable):
+        self._in_flight += 1
+        self._in_flight_by_user[user_id] = self._in_flight_by_user.get(user_id, 0) + 1
+
+    def _acquire(self, user_id: Hashable):
+        with self._cond:
+            # Free slots are handed to waiters on release, so waiters left behind
+            # while a slot is free are all users at their in-flight cap
+            if self._in_flight < self.max_concurrent and self._in_flight_by_user.get(user_id, 0) < self.max_in_flight_per_user:
+                self._start(user_id)
+                return
+
+            user_waiting = self._waiting.get(user_id)
+            if self._queued >= self.max_queued:
+                raise AdmissionRejected(self._retry_after(), "Server busy")
+            if user_waiting is not None and len(user_waiting) >= self.max_queued_per_user:
+                raise AdmissionRejected(self._retry_after(), "Too many requests in flight")
+
+            ticket = object()
+            if user_waiting is None:
+                user_waiting = self._waiting[user_id] = deque()
+                self._turns.append(user_id)
+            user_waiting.append(ticket)
+            self._queued += 1
+
+            deadline = time.monotonic() + self.timeout
+            while ticket not in self._granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove(user_id, ticket)
+                    raise AdmissionRejected(self._retry_after(), "Timed out waiting for capacity")
+                self._cond.wait(remaining)
+            self._granted.discard(ticket)
+
+    def _remove(self, user_id: Hashable, ticket: object):
+        user_waiting = self._waiting.get(user_id)
+        if user_waiting is None or ticket not in user_waiting:
+            return
+        user_waiting.remove(ticket)
+        self._queued -= 1
+        if not user_waiting:
+            del self._waiting[user_id]
+            self._turns.remove(user_id)
+
+    def _release(self, user_id: Hashable, service_seconds: float):
+        with self._cond:
+            self._avg_service = 0.8 * self._avg_service + 0.2 * service_seconds
+            self._in_flight -= 1
+            remaining = self._in_flight_by_user.get(user_id, 1) - 1
+            if remaining:
+                self._in_flight_by_user[user_id] = remaining
+            else:
+                self._in_flight_by_user.pop(user_id, None)
+            if self._dispatch():
+                self._cond.notify_all()
+
+    def _dispatch(self) -> bool:
+        """Hand free slots to waiters in round-robin order, skipping users at their in-flight cap."""
+        granted = False
+        for _ in range(len(self._turns)):
+            if self._in_flight >= self.max_concurrent:
+                break
+            user_id = self._turns.popleft()
+            if self._in_flight_by_user.get(user_id, 0) >= self.max_in_flight_per_user:
+                self._turns.append(user_id)
+                continue
+            user_waiting = self._waiting[user_id]
+            self._granted.add(user_waiting.popleft())
+            self._queued -= 1
+            self._start(user_id)
+            granted = True
+            if user_waiting:
+                self._turns.append(user_id)
+            else:
+                del self._waiting[user_id]
+        return granted
+
+
+chat_rate_limiter = TokenBucketLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST)
+# Never let waiters (plus the calls in flight) fill the whole threadpool
+llm_queue = FairQueue(
+    LLM_MAX_CONCURRENT,
+    max(0, min(LLM_QUEUE_SIZE, THREADPOOL_SIZE - LLM_MAX_CONCURRENT - THREADPOOL_RESERVE)),
+    LLM_QUEUE_PER_USER,
+    LLM_QUEUE_TIMEOUT_SECONDS,
+    LLM_MAX_IN_FLIGHT_PER_USER,
+)
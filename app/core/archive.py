@@ -0,0 +1,292 @@
+"""
+Cold-storage tiering for idle chat sessions.
+
+Sessions whose newest message is older than N days have their history moved
+out of `chat_history` into append-only segment files under ARCHIVE_DIR. Each
+session is one frame: its rows as JSON lines, compressed and encrypted with the
+storage codec (app/core/encryption.py). `archived_sessions` maps a session_id
+to (segment, offset, length), so a session is reloaded with a single read.
+
+get_history() restores an archived session into the hot table on access.
+
+Segments are append-only: restoring, re-archiving or deleting a session only
+drops its `archived_sessions` pointer, and the old frame stays on disk until
+compact_segments() copies the live frames of mostly-dead segments into new
+segments and deletes every segment nothing points at any more.
+
+Run both from cron (or any scheduler):
+    python -m app.core.archive --idle-days 30
+    python -m app.core.archive --compact
+"""
+import argparse
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+import time
+from typing import Dict, List
+
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, ChatHistory, ArchivedSession, init_db
+from app.core.encryption import get_cipher, seal, unseal
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+SEGMENT_MAX_BYTES = int(os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+# Rewrite a segment once at least this share of its bytes belongs to no session
+COMPACT_MIN_DEAD_RATIO = float(os.getenv("ARCHIVE_COMPACT_MIN_DEAD_RATIO", "0.5"))
+# Segments modified this recently are left alone: an archiver may still be writing
+# a frame whose pointer is not committed yet
+COMPACT_GRACE_SECONDS = float(os.getenv("ARCHIVE_COMPACT_GRACE_SECONDS", "3600"))
+
+
+class SegmentWriter:
+    """Appends frames to the current segment file, starting a new one when it fills up."""
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, max_bytes: int = SEGMENT_MAX_BYTES):
+        self.archive_dir = archive_dir
+        self.max_bytes = max_bytes
+        self._name = None
+        self._file = None
+
+    def _open_new(self):
+        self.close()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._name = f"segment-{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.seg"
+        self._file = open(os.path.join(self.archive_dir, self._name), "ab")
+
+    def append(self, frame: bytes):
+        """Write a frame durably and return (segment, offset, length)."""
+        if self._file is None or self._file.tell() + len(frame) > self.max_bytes:
+            self._open_new()
+        offset = self._file.tell()
+        self._file.write(frame)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._name, offset, len(frame)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_frame(entry: ArchivedSession, archive_dir: str = ARCHIVE_DIR) -> List[dict]:
+    with open(os.path.join(archive_dir, entry.segment), "rb") as f:
+        f.seek(entry.offset)
+        frame = f.read(entry.length)
+    lines = unseal(frame).decode("utf-8").splitlines()
+    return [json.loads(line) for line in lines if line]
+
+
+def _encode_rows(rows) -> bytes:
+    lines = [
+        json.dumps({
+            "user_id": r["user_id"],
+            "role": r["role"],
+            "content": r["content"],
+            "timestamp": r["timestamp"].isoformat() if isinstance(r["timestamp"], datetime) else r["timestamp"],
+        })
+        for r in rows
+    ]
+    return seal("\n".join(lines).encode("utf-8"))
+
+
+def restore_session(db: Session, session_id: str) -> int:
+    """Move an archived session's history back into chat_history. Returns rows restored."""
+    entry = db.get(ArchivedSession, session_id)
+    if entry is None:
+        return 0
+
+    try:
+        rows = read_frame(entry)
+    except FileNotFoundError:
+        # Compaction moved the frame and deleted the segment after we read the pointer
+        db.refresh(entry)
+        rows = read_frame(entry)
+    # Claim the entry before inserting: when two requests restore the same session,
+    # the second one's delete matches nothing and it leaves the history alone
+    claimed = db.execute(
+        delete(ArchivedSession)
+        .where(
+            ArchivedSession.session_id == session_id,
+            ArchivedSession.segment == entry.segment,
+            ArchivedSession.offset == entry.offset,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.expunge(entry)
+    if not claimed:
+        db.rollback()
+        return 0
+
+    if rows:
+        db.execute(insert(ChatHistory), [
+            {
+                "user_id": r["user_id"],
+                "session_id": session_id,
+                "role": r["role"],
+                "content": r["content"],
+                "timestamp": datetime.fromisoformat(r["timestamp"]) if r["timestamp"] else None,
+            }
+            for r in rows
+        ])
+    db.commit()
+    print(f"[INFO] Restored archived session {session_id} ({len(rows)} messages)")
+    return len(rows)
+
+
+def archive_idle_sessions(idle_days: int = 30, limit: int = 1000) -> int:
+    """Move up to `limit` sessions idle for more than `idle_days` into cold storage."""
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+    db = SessionLocal()
+    writer = SegmentWriter()
+    archived = 0
+    try:
+        idle = (
+            db.query(ChatHistory.session_id)
+            .group_by(ChatHistory.session_id)
+            .having(func.max(ChatHistory.timestamp) < cutoff)
+            .limit(limit)
+            .all()
+        )
+        for (session_id,) in idle:
+            history = (
+                db.query(ChatHistory.id, ChatHistory.user_id, ChatHistory.role, ChatHistory.content, ChatHistory.timestamp)
+                .filter(ChatHistory.session_id == session_id)
+                .order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc())
+                .all()
+            )
+            if not history:
+                continue
+            rows = [row._asdict() for row in history]
+            # Messages written after this read stay hot; get_history merges them back in
+            max_id = max(row.id for row in history)
+
+            # Already archived once (and written to since): fold the older frame in
+            previous = db.get(ArchivedSession, session_id)
+            if previous is not None:
+                rows = read_frame(previous) + rows
+                db.delete(previous)
+                db.flush()
+
+            # Segment write is fsynced before the hot rows are deleted
+            segment, offset, length = writer.append(_encode_rows(rows))
+            db.add(ArchivedSession(
+                session_id=session_id,
+                user_id=rows[0]["user_id"] if rows else None,
+                segment=segment,
+                offset=offset,
+                length=length,
+                row_count=len(rows),
+            ))
+            db.query(ChatHistory).filter(
+                ChatHistory.session_id == session_id, ChatHistory.id <= max_id
+            ).delete(synchronize_session=False)
+            db.commit()
+            archived += 1
+    finally:
+        writer.close()
+        db.close()
+
+    print(f"[INFO] Archived {archived} idle sessions (idle > {idle_days} days)")
+    return archived
+
+
+def compact_segments(
+    min_dead_ratio: float = COMPACT_MIN_DEAD_RATIO,
+    grace_seconds: float = COMPACT_GRACE_SECONDS,
+    reseal: bool = False,
+) -> dict:
+    """
+    Copy the live frames out of segments that are at least `min_dead_ratio` dead,
+    repoint their sessions, then delete segments no session points at. Safe to
+    run while the app serves requests: a pointer is only moved if it still
+    refers to the frame that was copied.
+
+    reseal=True (key rotation) copies every live frame, re-encrypted with the
+    current primary storage key, so no session depends on an older key.
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return {"rewritten": 0, "moved": 0, "deleted": 0, "freed_bytes": 0}
+    cutoff = time.time() - grace_seconds
+    db = SessionLocal()
+    writer = SegmentWriter()
+    moved = rewritten = 0
+    try:
+        # 1. Live bytes per segment
+        live: Dict[str, int] = dict(
+            db.query(ArchivedSession.segment, func.sum(ArchivedSession.length))
+            .group_by(ArchivedSession.segment)
+            .all()
+        )
+        candidates = []
+        for name in os.listdir(ARCHIVE_DIR):
+            path = os.path.join(ARCHIVE_DIR, name)
+            if not name.endswith(".seg") or not live.get(name):
+                continue
+            if reseal:
+                candidates.append(name)
+                continue
+            size = os.path.getsize(path)
+            if os.path.getmtime(path) <= cutoff and 1 - live[name] / size >= min_dead_ratio:
+                candidates.append(name)
+
+        # 2. Copy each live frame and move its pointer, unless the session changed meanwhile
+        for segment in candidates:
+            entries = (
+                db.query(ArchivedSession.session_id, ArchivedSession.offset, ArchivedSession.length)
+                .filter(ArchivedSession.segment == segment)
+                .order_by(ArchivedSession.offset)
+                .all()
+            )
+            with open(os.path.join(ARCHIVE_DIR, segment), "rb") as f:
+                for entry in entries:
+                    f.seek(entry.offset)
+                    frame = f.read(entry.length)
+                    if reseal:
+                        frame = get_cipher().rotate(frame)
+                    new_segment, new_offset, new_length = writer.append(frame)
+                    moved += db.execute(
+                        update(ArchivedSession)
+                        .where(
+                            ArchivedSession.session_id == entry.session_id,
+                            ArchivedSession.segment == segment,
+                            ArchivedSession.offset == entry.offset,
+                        )
+                        .values(segment=new_segment, offset=new_offset, length=new_length)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+            db.commit()
+            rewritten += 1
+
+        # 3. Delete segments nothing points at (deleted or restored sessions, rewritten segments)
+        referenced = {segment for (segment,) in db.query(ArchivedSession.segment).distinct()}
+    finally:
+        writer.close()
+        db.close()
+
+    deleted = freed = 0
+    for name in os.listdir(ARCHIVE_DIR):
+        path = os.path.join(ARCHIVE_DIR, name)
+        if name.endswith(".seg") and name not in referenced and os.path.getmtime(path) <= cutoff:
+            freed += os.path.getsize(path)
+            os.remove(path)
+            deleted += 1
+    result = {"rewritten": rewritten, "moved": moved, "deleted": deleted, "freed_bytes": freed}
+    print(f"[INFO] Archive compaction: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Move idle chat sessions to cold storage.")
+    arg_parser.add_argument("--idle-days", type=int, default=30)
+    arg_parser.add_argument("--limit", type=int, default=1000)
+    arg_parser.add_argument("--compact", action="store_true", help="Reclaim space from dead frames instead of archiving")
+    args = arg_parser.parse_args()
+    init_db()
+    if args.compact:
+        compact_segments()
+    else:
+        archive_idle_sessions(args.idle_days, args.limit)
@@ -0,0 +1,581 @@
+"""
+Online backups, incremental change capture and per-user export/restore.
+
+    python -m app.core.backup snapshot     --dest backups/full-1
+    python -m app.core.backup incremental  --dest backups/inc-1 --since backups/full-1
+    python -m app.core.backup restore      --snapshot backups/full-1 [--apply backups/inc-1 ...]
+    python -m app.core.backup export-user  --user-id 7 --out user7.jsonl.gz
+    python -m app.core.backup restore-user --file user7.jsonl.gz [--user-id 7]
+
+Full snapshots
+    SQLite: the online backup API copies BACKUP_PAGES_PER_STEP pages at a time and
+    sleeps between steps, so writers are never blocked for long.
+    Postgres: every table is streamed with COPY ... TO STDOUT (gzip CSV) inside one
+    REPEATABLE READ transaction, so the dump is consistent.
+    If a shared RAG index has been published (app/rag/index_store.py), its current
+    version is copied too, so a restore can serve retrieval without re-embedding.
+    The cold-storage segment files (app/core/archive.py) are copied after the
+    database, so every frame the copy points at is present.
+
+Incremental backups
+    For the CDC_TABLES: rows added since the previous backup's watermarks (id, or
+    a timestamp for tables keyed by a string) plus the keys still alive, so
+    deletions can be replayed. Content is copied as stored (still sealed by
+    app/core/encryption.py). Segment files written since the previous backup are
+    copied too.
+
+Per-user export
+    Everything belonging to one user (including archived sessions) as decoded
+    JSON lines, portable between deployments with different storage keys.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Text, column as sql_column, func, insert, select, table as sql_table, type_coerce
+
+from app.database import (
+    engine, SessionLocal, init_db,
+    User, ChatSession, ChatHistory, ArchivedSession, UserMemory, Reminder,
+)
+from app.core.profiles import invalidate_login
+
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_SECONDS = float(os.getenv("BACKUP_STEP_SLEEP_SECONDS", "0.01"))
+
+MANIFEST = "manifest.json"
+# table -> (model, watermark column); sessions first so history never points at a missing session.
+# archived_sessions rows are replaced (new archived_at) when a session is archived again.
+CDC_TABLES = {
+    "chat_sessions": (ChatSession, "created_at"),
+    "chat_history": (ChatHistory, "id"),
+    "archived_sessions": (ArchivedSession, "archived_at"),
+    "user_memory": (UserMemory, "id"),
+}
+DATE_COLUMNS = ("timestamp", "created_at", "archived_at", "due_date")
+
+
+# --- Helpers ---
+def _dialect() -> str:
+    return engine.dialect.name
+
+
+def _write_manifest(dest: str, manifest: dict):
+    with open(os.path.join(dest, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+
+def _read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value)}")
+
+
+def _pk(model):
+    """The single primary key column (id, or session_id for archived_sessions)."""
+    return list(model.__table__.primary_key.columns)[0]
+
+
+def _is_datetime(model, column: str) -> bool:
+    return model.__table__.c[column].type.python_type is datetime
+
+
+def _serial_tables() -> List[str]:
+    """Tables keyed by an integer id, whose Postgres sequence must follow restored rows."""
+    from app.database import Base
+
+    return [
+        table.name for table in Base.metadata.sorted_tables
+        if "id" in table.c and table.c.id.primary_key and table.c.id.type.python_type is int
+    ]
+
+
+def _raw_columns(model):
+    """Select every column as stored, so sealed content is not decoded."""
+    return [type_coerce(col, Text).label(col.name) if col.name == "content" else col for col in model.__table__.columns]
+
+
+def _id_ranges(ids: Iterable[int]) -> List[List[int]]:
+    ranges: List[List[int]] = []
+    for i in ids:
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+def _in_ranges(i: int, ranges: List[List[int]]) -> bool:
+    lo, hi = 0, len(ranges) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if i < ranges[mid][0]:
+            hi = mid - 1
+        elif i > ranges[mid][1]:
+            lo = mid + 1
+        else:
+            return True
+    return False
+
+
+def _mark(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _watermarks(conn) -> Dict[str, Optional[str]]:
+    marks = {}
+    for table, (model, column) in CDC_TABLES.items():
+        marks[table] = _mark(conn.execute(select(func.max(getattr(model, column)))).scalar())
+    return marks
+
+
+def _copy_archive(dest: str, modified_after: Optional[float] = None) -> dict:
+    """
+    Copy cold-storage segments (only those written since `modified_after`, a Unix
+    time, for incrementals). Returns the manifest entry; call it after the
+    database copy, since segments are written before the rows that point at them.
+    """
+    from app.core.archive import ARCHIVE_DIR
+
+    started = time.time()
+    copied = []
+    if os.path.isdir(ARCHIVE_DIR):
+        target = os.path.join(dest, "archive")
+        for name in sorted(os.listdir(ARCHIVE_DIR)):
+            source = os.path.join(ARCHIVE_DIR, name)
+            if not os.path.isfile(source):
+                continue
+            if modified_after is not None and os.path.getmtime(source) < modified_after:
+                continue
+            os.makedirs(target, exist_ok=True)
+            shutil.copy2(source, os.path.join(target, name))
+            copied.append(name)
+    return {"copied_at": started, "segments": copied}
+
+
+def _restore_archive(path: str):
+    from app.core.archive import ARCHIVE_DIR
+
+    source = os.path.join(path, "archive")
+    if not os.path.isdir(source):
+        return
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for name in os.listdir(source):
+        shutil.copy2(os.path.join(source, name), os.path.join(ARCHIVE_DIR, name))
+    print(f"[INFO] Restored archive segments from {path}")
+
+
+def _reset_sequences(cursor):
+    """Postgres: move each id sequence past the restored rows, or new inserts collide."""
+    for table in _serial_tables():
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE(max(id), 1), max(id) IS NOT NULL) "
+            f'FROM "{table}"'
+        )
+
+
+def _copy_index_version(dest: str) -> Optional[str]:
+    from app.rag import index_store
+
+    try:
+        with open(index_store.CURRENT_FILE, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    source = os.path.join(index_store.INDEX_DIR, version)
+    if not os.path.isdir(source):
+        return None
+    shutil.copytree(source, os.path.join(dest, "index", version))
+    return version
+
+
+# --- Full snapshot ---
+def _sqlite_online_backup(source_path: str, dest_path: str):
+    src = sqlite3.connect(source_path)
+    dst = sqlite3.connect(dest_path)
+    try:
+        def progress(status, remaining, total):
+            print(f"[INFO] Backup: {total - remaining}/{total} pages copied")
+
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_STEP_SLEEP_SECONDS)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _postgres_copy_dump(dest: str) -> Dict[str, Optional[str]]:
+    """Dump every table in one REPEATABLE READ transaction; returns the watermarks of that same snapshot."""
+    raw = engine.raw_connection()
+    driver = raw.driver_connection
+    try:
+        # psycopg2 opens its own transaction on the first statement, so a BEGIN would be ignored
+        driver.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cursor = raw.cursor()
+        marks = {}
+        for table, (model, column) in CDC_TABLES.items():
+            cursor.execute(f'SELECT max("{column}") FROM "{table}"')
+            marks[table] = _mark(cursor.fetchone()[0])
+        for table in _table_names():
+            with gzip.open(os.path.join(dest, f"{table}.csv.gz"), "wb") as f:
+                # Streams rows straight from the server into the gzip file (psycopg2)
+                cursor.copy_expert(f'COPY (SELECT * FROM "{table}") TO STDOUT WITH CSV HEADER', f)
+            print(f"[INFO] Backup: dumped {table}")
+        raw.commit()
+        return marks
+    finally:
+        # The connection goes back to the pool: undo the session settings
+        raw.rollback()
+        driver.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+        raw.close()
+
+
+def _table_names() -> List[str]:
+    from app.database import Base
+
+    return [table.name for table in Base.metadata.sorted_tables]
+
+
+def snapshot(dest: str) -> dict:
+    os.makedirs(dest, exist_ok=False)
+    started = time.perf_counter()
+    if _dialect() == "sqlite":
+        db_path = os.path.join(dest, "database.sqlite")
+        _sqlite_online_backup(engine.url.database, db_path)
+        # Watermarks come from the copy itself, so they match its contents exactly
+        from sqlalchemy import create_engine
+
+        snapshot_engine = create_engine(f"sqlite:///{db_path}")
+        with snapshot_engine.connect() as conn:
+            marks = _watermarks(conn)
+        snapshot_engine.dispose()
+    elif _dialect() == "postgresql":
+        marks = _postgres_copy_dump(dest)
+    else:
+        raise RuntimeError(f"Backups are not supported for {_dialect()}")
+
+    manifest = {
+        "kind": "full",
+        "dialect": _dialect(),
+        "created_at": datetime.utcnow().isoformat(),
+        "watermarks": marks,
+        "index_version": _copy_index_version(dest),
+        "archive": _copy_archive(dest),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+    _write_manifest(dest, manifest)
+    print(f"[SUCCESS] Snapshot written to {dest}")
+    return manifest
+
+
+# --- Incremental change capture ---
+def incremental(dest: str, since: str) -> dict:
+    base = _read_manifest(since)
+    os.makedirs(dest, exist_ok=False)
+    db = SessionLocal()
+    counts = {}
+    try:
+        # One transaction, so the new rows and the live id ranges agree
+        with db.begin():
+            marks = _watermarks(db)
+            for table, (model, column) in CDC_TABLES.items():
+                previous = base["watermarks"].get(table)
+                query = select(*_raw_columns(model))
+                if previous is not None:
+                    bound = datetime.fromisoformat(previous) if _is_datetime(model, column) else previous
+                    query = query.where(getattr(model, column) > bound)
+                query = query.order_by(getattr(model, column))
+
+                count = 0
+                with gzip.open(os.path.join(dest, f"{table}.jsonl.gz"), "wt", encoding="utf-8") as f:
+                    for row in db.execute(query.execution_options(stream_results=True, yield_per=1000)):
+                        f.write(json.dumps(dict(row._mapping), default=_json_default) + "\n")
+                        count += 1
+                counts[table] = count
+
+                # Deletions: the keys that still exist (integer ids as compact ranges)
+                pk = _pk(model)
+                ids = db.execute(select(pk).order_by(pk).execution_options(yield_per=10000)).scalars()
+                with open(os.path.join(dest, f"{table}.live.json"), "w", encoding="utf-8") as f:
+                    json.dump(_id_ranges(ids) if pk.type.python_type is int else list(ids), f)
+    finally:
+        db.close()
+
+    manifest = {
+        "kind": "incremental",
+        "dialect": _dialect(),
+        "created_at": datetime.utcnow().isoformat(),
+        "base": os.path.abspath(since),
+        "watermarks": marks,
+        "rows": counts,
+        "index_version": _copy_index_version(dest),
+        # Segments only grow or appear; anything touched since the base copied them
+        "archive": _copy_archive(dest, modified_after=base.get("archive", {}).get("copied_at")),
+    }
+    _write_manifest(dest, manifest)
+    print(f"[SUCCESS] Incremental backup written to {dest}: {counts}")
+    return manifest
+
+
+def _is_live(model, live):
+    if _pk(model).type.python_type is int:
+        return lambda i: _in_ranges(i, live)
+    live = set(live)
+    return lambda i: i in live
+
+
+def apply_incremental(path: str):
+    manifest = _read_manifest(path)
+    db = SessionLocal()
+    try:
+        # 1. Replay deletions, newest dependents first
+        for table, (model, _) in reversed(list(CDC_TABLES.items())):
+            with open(os.path.join(path, f"{table}.live.json"), "r", encoding="utf-8") as f:
+                is_live = _is_live(model, json.load(f))
+            pk = _pk(model)
+            stale = [i for i in db.execute(select(pk)).scalars() if not is_live(i)]
+            for start in range(0, len(stale), 500):
+                db.query(model).filter(pk.in_(stale[start:start + 500])).delete(synchronize_session=False)
+
+        # 2. Insert the rows added since the previous backup
+        for table, (model, _) in CDC_TABLES.items():
+            batch = []
+            with gzip.open(os.path.join(path, f"{table}.jsonl.gz"), "rt", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    for key in DATE_COLUMNS:
+                        if row.get(key):
+                            row[key] = datetime.fromisoformat(row[key])
+                    batch.append(row)
+                    if len(batch) >= 1000:
+                        _insert_raw(db, model, batch)
+                        batch = []
+            if batch:
+                _insert_raw(db, model, batch)
+        if _dialect() == "postgresql":
+            _reset_sequences(db.connection().connection.cursor())
+        db.commit()
+    finally:
+        db.close()
+    _restore_archive(path)
+    _restore_index(path, manifest.get("index_version"))
+    print(f"[SUCCESS] Applied incremental backup {path}")
+
+
+def _insert_raw(db, model, rows: List[dict]):
+    # Re-archived sessions come back with the same key: replace the older row
+    pk = _pk(model)
+    db.query(model).filter(pk.in_([row[pk.name] for row in rows])).delete(synchronize_session=False)
+    # Content is already sealed: insert it through a plain Text column so it is not encoded again
+    raw_table = sql_table(
+        model.__tablename__,
+        *[sql_column(c.name, Text if c.name == "content" else c.type) for c in model.__table__.columns],
+    )
+    db.execute(insert(raw_table), rows)
+
+
+# --- Restore ---
+def _restore_index(path: str, version: Optional[str]):
+    """Install the backed-up index version as current, so retrieval needs no re-embedding."""
+    if not version:
+        return
+    from app.rag import index_store
+
+    source = os.path.join(path, "index", version)
+    target = os.path.join(index_store.INDEX_DIR, version)
+    if not os.path.isdir(target):
+        os.makedirs(index_store.INDEX_DIR, exist_ok=True)
+        shutil.copytree(source, target)
+    tmp_current = index_store.CURRENT_FILE + ".tmp"
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_current, index_store.CURRENT_FILE)
+    print(f"[INFO] Restored RAG index {version}")
+
+
+def restore(snapshot_dir: str, apply: Iterable[str] = ()):
+    """Restore a full snapshot (stop the app first), then replay incrementals in order."""
+    manifest = _read_manifest(snapshot_dir)
+    if manifest["dialect"] != _dialect():
+        raise RuntimeError(f"Snapshot is for {manifest['dialect']}, database is {_dialect()}")
+
+    if _dialect() == "sqlite":
+        src = sqlite3.connect(os.path.join(snapshot_dir, "database.sqlite"))
+        dst = sqlite3.connect(engine.url.database)
+        try:
+            src.backup(dst, pages=BACKUP_PAGES_PER_STEP)
+        finally:
+            dst.close()
+            src.close()
+    else:
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            tables = _table_names()
+            cursor.execute("TRUNCATE " + ", ".join(f'"{t}"' for t in tables))
+            for table in tables:
+                with gzip.open(os.path.join(snapshot_dir, f"{table}.csv.gz"), "rb") as f:
+                    cursor.copy_expert(f'COPY "{table}" FROM STDIN WITH CSV HEADER', f)
+            _reset_sequences(cursor)
+            raw.commit()
+        finally:
+            raw.close()
+
+    _restore_archive(snapshot_dir)
+    _restore_index(snapshot_dir, manifest.get("index_version"))
+    for path in apply:
+        apply_incremental(path)
+    print(f"[SUCCESS] Restored snapshot {snapshot_dir}")
+
+
+# --- Per-user export / restore ---
+def export_user(user_id: int, out_path: str) -> int:
+    from app.core.archive import read_frame
+
+    db = SessionLocal()
+    written = 0
+    try:
+        with gzip.open(out_path, "wt", encoding="utf-8") as f:
+            def emit(table: str, row: dict):
+                nonlocal written
+                f.write(json.dumps({"table": table, "row": row}, default=_json_default) + "\n")
+                written += 1
+
+            user = db.query(User).filter(User.id == user_id).first()
+            if user is None:
+                raise ValueError(f"User {user_id} not found")
+            emit("users", {"username": user.username, "email": user.email, "full_name": user.full_name})
+
+            for s in db.query(ChatSession).filter(ChatSession.user_id == user_id).yield_per(500):
+                emit("chat_sessions", {"id": s.id, "title": s.title, "created_at": s.created_at})
+            for h in db.query(ChatHistory).filter(ChatHistory.user_id == user_id).order_by(ChatHistory.id).yield_per(500):
+                emit("chat_history", {"session_id": h.session_id, "role": h.role, "content": h.content, "timestamp": h.timestamp})
+            for entry in db.query(ArchivedSession).filter(ArchivedSession.user_id == user_id):
+                for r in read_frame(entry):
+                    emit("chat_history", {"session_id": entry.session_id, "role": r["role"], "content": r["content"], "timestamp": r["timestamp"]})
+            for m in db.query(UserMemory).filter(UserMemory.user_id == user_id).yield_per(500):
+                emit("user_memory", {"content": m.content})
+            for r in db.query(Reminder).filter(Reminder.user_id == user_id).yield_per(500):
+                emit("reminders", {"content": r.content, "due_date": r.due_date, "is_completed": r.is_completed, "created_at": r.created_at})
+    finally:
+        db.close()
+    print(f"[SUCCESS] Exported {written} records for user {user_id} to {out_path}")
+    return written
+
+
+def restore_user(in_path: str, user_id: Optional[int] = None) -> int:
+    """
+    Replace a user's sessions, history, memories and reminders with an export.
+    Without --user-id the user is matched (or created) by the exported email.
+    """
+    def parse_dates(row: dict, *keys):
+        for key in keys:
+            if row.get(key):
+                row[key] = datetime.fromisoformat(row[key])
+        return row
+
+    db = SessionLocal()
+    restored = 0
+    login_email = None
+    try:
+        with gzip.open(in_path, "rt", encoding="utf-8") as f:
+            records = (json.loads(line) for line in f if line.strip())
+            first = next(records, None)
+            if first is None:
+                raise ValueError(f"Export file {in_path} is empty")
+            if first["table"] != "users":
+                raise ValueError("Export must start with the user record")
+            profile = first["row"]
+
+            if user_id is None:
+                user = db.query(User).filter(User.email == profile["email"]).first()
+                if user is None:
+                    from app.auth import EXTERNAL_AUTH_MARKER
+
+                    user = User(username=profile["username"], email=profile["email"],
+                                full_name=profile["full_name"], password=EXTERNAL_AUTH_MARKER)
+                    db.add(user)
+                    db.flush()
+                user_id = user.id
+            login_email = profile["email"]
+
+            # Replace whatever the user has now
+            session_ids = [sid for (sid,) in db.query(ChatSession.id).filter(ChatSession.user_id == user_id)]
+            db.query(ChatHistory).filter(ChatHistory.user_id == user_id).delete(synchronize_session=False)
+            db.query(ArchivedSession).filter(ArchivedSession.user_id == user_id).delete(synchronize_session=False)
+            db.query(ChatSession).filter(ChatSession.id.in_(session_ids)).delete(synchronize_session=False)
+            db.query(UserMemory).filter(UserMemory.user_id == user_id).delete(synchronize_session=False)
+            db.query(Reminder).filter(Reminder.user_id == user_id).delete(synchronize_session=False)
+
+            models = {"chat_sessions": ChatSession, "chat_history": ChatHistory, "user_memory": UserMemory, "reminders": Reminder}
+            pending: Dict[str, List[dict]] = {name: [] for name in models}
+
+            def flush(name: str):
+                if pending[name]:
+                    db.execute(insert(models[name]), pending[name])
+                    pending[name] = []
+
+            for record in records:
+                name = record["table"]
+                if name not in models:
+                    continue
+                row = parse_dates({**record["row"], "user_id": user_id}, *DATE_COLUMNS)
+                pending[name].append(row)
+                restored += 1
+                if len(pending[name]) >= 500:
+                    # Sessions first, so history never points at a missing session
+                    flush("chat_sessions")
+                    flush(name)
+            for name in models:
+                flush(name)
+        db.commit()
+    finally:
+        db.close()
+    if login_email:
+        # The user may have been created here: drop any login cached for a previous row
+        invalidate_login(login_email)
+    print(f"[SUCCESS] Restored {restored} records for user {user_id}")
+    return restored
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="RepliMate backups")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("snapshot", help="Full online backup")
+    cmd.add_argument("--dest", required=True)
+    cmd = commands.add_parser("incremental", help="Changes since a previous backup")
+    cmd.add_argument("--dest", required=True)
+    cmd.add_argument("--since", required=True)
+    cmd = commands.add_parser("restore", help="Restore a snapshot (stop the app first)")
+    cmd.add_argument("--snapshot", required=True)
+    cmd.add_argument("--apply", nargs="*", default=[])
+    cmd = commands.add_parser("export-user", help="Export one user's data")
+    cmd.add_argument("--user-id", type=int, required=True)
+    cmd.add_argument("--out", required=True)
+    cmd = commands.add_parser("restore-user", help="Restore one user's data from an export")
+    cmd.add_argument("--file", required=True)
+    cmd.add_argument("--user-id", type=int, default=None)
+
+    args = arg_parser.parse_args()
+    init_db()
+    if args.command == "snapshot":
+        snapshot(args.dest)
+    elif args.command == "incremental":
+        incremental(args.dest, args.since)
+    elif args.command == "restore":
+        restore(args.snapshot, args.apply)
+    elif args.command == "export-user":
+        export_user(args.user_id, args.out)
+    elif args.command == "restore-user":
+        restore_user(args.file, args.user_id)
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Small thread-safe LRU cache with an optional per-entry time-to-live."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value; `ttl` overrides the cache-wide time-to-live for this entry."""
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- Optional shared backend ---
+# Set REDIS_URL (and install `redis`) to share cached values between uvicorn
+# workers. Without it every worker keeps its own in-process copy.
+REDIS_URL = os.getenv("REDIS_URL", "")
+_redis_client = None
+
+
+def get_redis():
+    """Return a Redis client if REDIS_URL is set and the package is installed, else None."""
+    global _redis_client
+    if _redis_client is None and REDIS_URL:
+        try:
+            import redis
+        except ImportError:
+            print("[WARN] REDIS_URL is set but the 'redis' package is not installed; using in-process caches.")
+            return None
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+class SharedCache:
+    """
+    JSON-value cache that lives in Redis when a shared backend is configured,
+    and in a local TTLCache otherwise. With Redis there is no local tier, so an
+    invalidation in one worker is seen by all of them immediately.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _key(self, key: Hashable) -> str:
+        return f"replimate:{self.namespace}:{key}"
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        client = get_redis()
+        if client is None:
+            return self._local.get(key, default)
+        try:
+            raw = client.get(self._key(key))
+        except Exception as e:
+            print(f"[WARN] Shared cache read failed: {e}")
+            return default
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key: Hashable, value: Any):
+        client = get_redis()
+        if client is None:
+            self._local.set(key, value)
+            return
+        try:
+            client.set(self._key(key), json.dumps(value), ex=int(self.ttl) if self.ttl else None)
+        except Exception as e:
+            print(f"[WARN] Shared cache write failed: {e}")
+
+    def delete(self, key: Hashable):
+        self._local.delete(key)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.delete(self._key(key))
+            except Exception as e:
+                print(f"[WARN] Shared cache invalidation failed: {e}")
@@ -0,0 +1,295 @@
+"""
+Background consolidation of each user's memories.
+
+Long-time users pile up small, overlapping UserMemory rows ("I like tea",
+"I like green tea", ...). For every user with at least CONSOLIDATION_MIN_MEMORIES
+memories, this job:
+
+1. gets an embedding per memory (reused from the live local index when it holds
+   them, otherwise computed in batches),
+2. groups memories whose cosine similarity to a group's first member is at
+   least CONSOLIDATION_SIMILARITY,
+3. merges up to CONSOLIDATION_MAX_CLUSTERS groups with ONE LLM call per user,
+4. in one transaction inserts each canonical memory, records the originals
+   in memory_provenance and deletes them,
+5. swaps the affected documents in the live index by id (a full reload in shared
+   index mode).
+
+Runs every CONSOLIDATION_INTERVAL_HOURS in the app process (0 = off, the default),
+or from the command line:
+
+    RAG_INDEX_MODE=shared REDIS_URL=... python -m app.core.consolidation [--user-id 7] [--dry-run]
+
+Outside the API process (this CLI, app.worker) the changes only reach the API
+through the shared index and the shared version counters, so that needs
+RAG_INDEX_MODE=shared and Redis; see out_of_process_ready().
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+
+from app.database import SessionLocal, UserMemory, MemoryProvenance, init_db
+from app.core.admission import llm_queue
+from app.core.versions import bump, shared as versions_shared
+
+CONSOLIDATION_INTERVAL_HOURS = float(os.getenv("CONSOLIDATION_INTERVAL_HOURS", "0"))
+CONSOLIDATION_MIN_MEMORIES = int(os.getenv("CONSOLIDATION_MIN_MEMORIES", "20"))
+CONSOLIDATION_SIMILARITY = float(os.getenv("CONSOLIDATION_SIMILARITY", "0.85"))
+CONSOLIDATION_MAX_CLUSTERS = int(os.getenv("CONSOLIDATION_MAX_CLUSTERS", "20"))
+CONSOLIDATION_MAX_CLUSTER_SIZE = int(os.getenv("CONSOLIDATION_MAX_CLUSTER_SIZE", "12"))
+CONSOLIDATION_MAX_MEMORIES = int(os.getenv("CONSOLIDATION_MAX_MEMORIES", "2000"))
+
+MERGE_PROMPT = """
+You maintain the long-term memory of a personal assistant about one user.
+Each numbered group below holds overlapping notes the user told the assistant,
+oldest first. For each group write ONE short first-person fact that keeps every
+detail that is still true; when notes disagree, the newer note wins.
+
+{groups}
+
+Return ONLY a valid JSON object mapping each group number to its merged fact,
+e.g. {{"1": "I like green tea but not coffee."}}
+"""
+
+
+def out_of_process_ready() -> bool:
+    """
+    Whether consolidation may run outside the API process: the index update must
+    be published to the shared index (a local one would be a throwaway copy) and
+    the memories version bump must reach the API's counters.
+    """
+    from app.rag import index_store
+
+    return index_store.shared_mode() and versions_shared()
+
+
+# --- Steps ---
+def _memory_vectors(memories: Sequence[Tuple[int, str]], embeddings):
+    """L2-normalised vectors for (id, content) memories, reusing live index vectors when possible."""
+    import numpy as np
+    from app.rag.loader import memory_doc_id
+    from app.routers.chat import rag_components, _rag_swap_lock
+
+    vectors: Dict[int, list] = {}
+    with _rag_swap_lock:
+        vectorstore = rag_components.get("vectorstore")
+        if vectorstore is not None and hasattr(vectorstore.index, "reconstruct"):
+            positions = {doc_id: pos for pos, doc_id in vectorstore.index_to_docstore_id.items()}
+            for memory_id, _content in memories:
+                pos = positions.get(memory_doc_id(memory_id))
+                if pos is not None:
+                    try:
+                        vectors[memory_id] = vectorstore.index.reconstruct(int(pos))
+                    except RuntimeError:
+                        break  # Index type cannot reconstruct; embed instead
+
+    missing = [(memory_id, content) for memory_id, content in memories if memory_id not in vectors]
+    if missing:
+        for (memory_id, _content), vector in zip(missing, embeddings.embed_documents([c for _, c in missing])):
+            vectors[memory_id] = vector
+
+    matrix = np.array([vectors[memory_id] for memory_id, _ in memories], dtype="float32")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def cluster_memories(memories: Sequence[Tuple[int, str]], vectors) -> List[List[Tuple[int, str]]]:
+    """
+    Leader clustering: each memory joins the first group whose leader it is at
+    least CONSOLIDATION_SIMILARITY-similar to. Returns groups of two or more.
+    """
+    leaders: List[int] = []
+    groups: List[List[int]] = []
+    for i in range(len(memories)):
+        if leaders:
+            similarities = vectors[leaders] @ vectors[i]
+            best = int(similarities.argmax())
+            if similarities[best] >= CONSOLIDATION_SIMILARITY and len(groups[best]) < CONSOLIDATION_MAX_CLUSTER_SIZE:
+                groups[best].append(i)
+                continue
+        leaders.append(i)
+        groups.append([i])
+    return [[memories[i] for i in group] for group in groups if len(group) > 1]
+
+
+def merge_clusters(user_id: int, clusters: List[List[Tuple[int, str]]], llm) -> Dict[int, str]:
+    """One LLM call for all of a user's clusters; returns {cluster index: canonical fact}."""
+    groups = "\n\n".join(
+        f"Group {n}:\n" + "\n".join(f"- {content}" for _id, content in cluster)
+        for n, cluster in enumerate(clusters, start=1)
+    )
+    with llm_queue.slot(user_id):
+        response = llm.invoke(MERGE_PROMPT.format(groups=groups))
+    # cleanup markdown code blocks if any
+    text = response.content.replace("```json", "").replace("```", "").strip()
+    merged = json.loads(text)
+
+    facts = {}
+    for key, fact in merged.items():
+        try:
+            index = int(key) - 1
+        except ValueError:
+            continue
+        if 0 <= index < len(clusters) and isinstance(fact, str) and fact.strip():
+            facts[index] = fact.strip()
+    return facts
+
+
+def _apply(user_id: int, clusters, facts: Dict[int, str]):
+    """Insert canonical memories, record provenance and delete the originals in one transaction."""
+    db = SessionLocal()
+    try:
+        added, removed = [], []
+        for index, fact in facts.items():
+            sources = clusters[index]
+            deleted = set(db.execute(
+                delete(UserMemory)
+                .where(UserMemory.user_id == user_id, UserMemory.id.in_([i for i, _ in sources]))
+                .returning(UserMemory.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            if len(deleted) < 2:
+                continue  # Deleted by the user meanwhile; leave what is left alone
+            canonical_id = db.execute(
+                insert(UserMemory).values(user_id=user_id, content=fact).returning(UserMemory.id)
+            ).scalar_one()
+            db.execute(insert(MemoryProvenance), [
+                {"user_id": user_id, "canonical_id": canonical_id, "source_id": memory_id, "source_content": content}
+                for memory_id, content in sources if memory_id in deleted
+            ])
+            added.append((canonical_id, fact))
+            removed.extend(deleted)
+        db.commit()
+        return added, removed
+    finally:
+        db.close()
+
+
+def consolidate_user(user_id: int, llm=None, embeddings=None, dry_run: bool = False) -> dict:
+    db = SessionLocal()
+    try:
+        memories = [
+            (row.id, row.content)
+            for row in db.query(UserMemory)
+            .filter(UserMemory.user_id == user_id)
+            .order_by(UserMemory.id)
+            .limit(CONSOLIDATION_MAX_MEMORIES)
+        ]
+    finally:
+        db.close()
+    result = {"user_id": user_id, "memories": len(memories), "clusters": 0, "merged": 0, "removed": 0}
+    if len(memories) < CONSOLIDATION_MIN_MEMORIES:
+        return result
+
+    if embeddings is None:
+        from app.rag.vectorstore import _get_embeddings
+        embeddings = _get_embeddings()
+    clusters = cluster_memories(memories, _memory_vectors(memories, embeddings))[:CONSOLIDATION_MAX_CLUSTERS]
+    result["clusters"] = len(clusters)
+    if not clusters or dry_run:
+        if dry_run:
+            result["preview"] = [[content for _id, content in cluster] for cluster in clusters]
+        return result
+
+    if llm is None:
+        llm = _default_llm()
+    facts = merge_clusters(user_id, clusters, llm)
+    added, removed = _apply(user_id, clusters, facts)
+    result.update(merged=len(added), removed=len(removed))
+    if not added:
+        return result
+
+    bump("memories", user_id)
+    from app.routers.chat import update_memory_index, reload_rag
+    try:
+        indexed = update_memory_index(user_id, added=added, removed_ids=removed)
+    except Exception as e:
+        print(f"[WARN] Incremental index update failed, falling back to a full reload: {e}")
+        indexed = False
+    if not indexed:
+        reload_rag()
+    return result
+
+
+def _default_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from app.rag.chain import LLMMetricsHandler
+
+    return ChatGoogleGenerativeAI(
+        model="models/gemini-2.5-flash",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0,
+        callbacks=[LLMMetricsHandler("consolidate")],
+    )
+
+
+def candidate_users() -> List[int]:
+    db = SessionLocal()
+    try:
+        return list(db.execute(
+            select(UserMemory.user_id)
+            .group_by(UserMemory.user_id)
+            .having(func.count(UserMemory.id) >= CONSOLIDATION_MIN_MEMORIES)
+        ).scalars())
+    finally:
+        db.close()
+
+
+def consolidate_all(user_id: Optional[int] = None, dry_run: bool = False) -> List[dict]:
+    results = []
+    for uid in ([user_id] if user_id is not None else candidate_users()):
+        try:
+            result = consolidate_user(uid, dry_run=dry_run)
+        except Exception as e:
+            # One user's failure (LLM busy, bad JSON) must not stop the others
+            print(f"[WARN] Memory consolidation failed for user {uid}: {e}")
+            continue
+        if result["merged"]:
+            print(f"[INFO] Consolidated {result['removed']} memories into {result['merged']} for user {uid}")
+        results.append(result)
+    return results
+
+
+# --- Periodic runner ---
+class ConsolidationScheduler:
+    def __init__(self, interval_hours: float = CONSOLIDATION_INTERVAL_HOURS):
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            consolidate_all()
+
+
+consolidation_scheduler = ConsolidationScheduler()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Merge overlapping user memories")
+    arg_parser.add_argument("--user-id", type=int, default=None)
+    arg_parser.add_argument("--dry-run", action="store_true", help="Only print the clusters that would be merged")
+    args = arg_parser.parse_args()
+
+    if not args.dry_run and not out_of_process_ready():
+        raise SystemExit(
+            "[ERROR] Consolidating outside the API process needs RAG_INDEX_MODE=shared and REDIS_URL, "
+            "or the API would keep serving the old memories. Use CONSOLIDATION_INTERVAL_HOURS instead."
+        )
+    init_db()
+    print(json.dumps(consolidate_all(args.user_id, dry_run=args.dry_run), indent=2))
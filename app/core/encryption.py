@@ -1,11 +1,161 @@
-from cryptography.fernet import Fernet
+import os
+import tempfile
+import threading
+import time
+import zlib
+from typing import Iterable, List, Optional
+
+from cryptography.fernet import Fernet, MultiFernet
+
+try:
+    import zstandard
+except ImportError:  # zlib fallback
+    zstandard = None
+
+# --- Keys ---
+# STORAGE_ENCRYPTION_KEYS="newest,older,..." (comma-separated Fernet keys).
+# The first key encrypts; every listed key can decrypt, so a key is rotated by
+# prepending a new one and running scripts/rotate_storage_key.py.
+# Without the variable, a key is generated once and persisted to STORAGE_KEY_FILE
+# (fine for local dev; set the variable on hosts with ephemeral disks).
+KEY_FILE = os.getenv("STORAGE_KEY_FILE", "data/storage.key")
+STORAGE_ENCRYPTION = os.getenv("STORAGE_ENCRYPTION", "1").lower() not in ("0", "false", "no")
+
+_cipher: Optional[MultiFernet] = None
+_cipher_lock = threading.Lock()
+
+
+def _read_key_file(wait_seconds: float = 5.0) -> List[bytes]:
+    # A file created by a non-atomic writer may briefly be empty; wait for its key
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        with open(KEY_FILE, "rb") as f:
+            keys = [line.strip() for line in f if line.strip()]
+        if keys or time.monotonic() >= deadline:
+            return keys
+        time.sleep(0.05)
+
+
+def _load_keys() -> List[bytes]:
+    env_keys = os.getenv("STORAGE_ENCRYPTION_KEYS", "").strip()
+    if env_keys:
+        return [k.strip().encode() for k in env_keys.split(",") if k.strip()]
+
+    if os.path.exists(KEY_FILE):
+        return _read_key_file()
+
+    print(f"[WARN] No STORAGE_ENCRYPTION_KEYS set. Generating a storage key at {KEY_FILE}")
+    key = Fernet.generate_key()
+    key_dir = os.path.dirname(KEY_FILE) or "."
+    os.makedirs(key_dir, exist_ok=True)
+    # Write the whole key to a private temp file, then link it into place: the key
+    # file appears complete or not at all, and only one of several workers
+    # starting at once wins; the others use the winner's key.
+    fd, tmp_path = tempfile.mkstemp(dir=key_dir, prefix=".storage-key-")  # mode 0600
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(key + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, KEY_FILE)
+        except FileExistsError:
+            return _read_key_file()
+    finally:
+        os.unlink(tmp_path)
+    return [key]
+
+
+def get_cipher() -> MultiFernet:
+    global _cipher
+    if _cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                _cipher = MultiFernet([Fernet(k) for k in _load_keys()])
+    return _cipher
 
-# Generate key (in real apps, store this securely)
-KEY = Fernet.generate_key()
-cipher = Fernet(KEY)
 
 def encrypt_text(text: str) -> bytes:
-    return cipher.encrypt(text.encode())
+    return get_cipher().encrypt(text.encode())
+
 
 def decrypt_text(token: bytes) -> str:
-    return cipher.decrypt(token).decode()
+    return get_cipher().decrypt(token).decode()
+
+
+# --- Storage codec ---
+# Stored value: PREFIX + Fernet(<1-byte codec tag> + payload).
+# Values without the prefix are legacy plaintext and are returned unchanged.
+PREFIX = "enc1:"
+COMPRESS_MIN_BYTES = 200
+
+_RAW, _ZLIB, _ZSTD = b"0", b"z", b"s"
+
+
+def _compress(data: bytes) -> bytes:
+    if len(data) < COMPRESS_MIN_BYTES:
+        return _RAW + data
+    if zstandard is not None:
+        packed = _ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+    else:
+        packed = _ZLIB + zlib.compress(data, 6)
+    # Keep it raw when compression doesn't pay for itself
+    return packed if len(packed) < len(data) + 1 else _RAW + data
+
+
+def _decompress(blob: bytes, zstd_decompressor=None) -> bytes:
+    tag, payload = blob[:1], blob[1:]
+    if tag == _RAW:
+        return payload
+    if tag == _ZLIB:
+        return zlib.decompress(payload)
+    if tag == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this value")
+        return (zstd_decompressor or zstandard.ZstdDecompressor()).decompress(payload)
+    raise ValueError(f"Unknown storage codec tag: {tag!r}")
+
+
+def seal(data: bytes) -> bytes:
+    """Compress, then encrypt with the primary storage key."""
+    return get_cipher().encrypt(_compress(data))
+
+
+def unseal(token: bytes, zstd_decompressor=None) -> bytes:
+    return _decompress(get_cipher().decrypt(token), zstd_decompressor)
+
+
+def encode_content(text: Optional[str]) -> Optional[str]:
+    if text is None or not STORAGE_ENCRYPTION:
+        return text
+    return PREFIX + seal(text.encode("utf-8")).decode("ascii")
+
+
+def decode_content(value: Optional[str]) -> Optional[str]:
+    if value is None or not value.startswith(PREFIX):
+        return value
+    return unseal(value[len(PREFIX):].encode("ascii")).decode("utf-8")
+
+
+def decode_many(values: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """Decode a batch of stored values, sharing one cipher and decompressor."""
+    cipher = get_cipher()
+    decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+    out = []
+    for value in values:
+        if value is None or not value.startswith(PREFIX):
+            out.append(value)
+            continue
+        blob = cipher.decrypt(value[len(PREFIX):].encode("ascii"))
+        out.append(_decompress(blob, decompressor).decode("utf-8"))
+    return out
+
+
+def reencode_content(value: Optional[str]) -> Optional[str]:
+    """Re-encrypt a stored value with the current primary key (encrypts legacy plaintext too)."""
+    if value is None:
+        return None
+    if not value.startswith(PREFIX):
+        return encode_content(value)
+    rotated = get_cipher().rotate(value[len(PREFIX):].encode("ascii"))
+    return PREFIX + rotated.decode("ascii")
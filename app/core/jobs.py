@@ -0,0 +1,176 @@
+"""
+Durable job queue backed by the `jobs` table.
+
+With JOB_QUEUE=1 the API only enqueues deferred work (index rebuilds, memory
+consolidation); `python -m app.worker` claims and runs it in a separate process.
+Without it, that work keeps running as FastAPI BackgroundTasks in the web process.
+
+- enqueue() stages a job on the caller's session, so it is committed atomically
+  with the write that caused it. submit_job() is the same with its own session.
+- A dedupe_key keeps at most one *queued* job per key: ten memory writes in a
+  row leave one pending rebuild.
+- claim() leases up to N ready jobs in one statement (FOR UPDATE SKIP LOCKED on
+  Postgres; SQLite serialises writers anyway). Jobs whose lease expires, because
+  their worker died, are claimed again.
+- fail() requeues with exponential backoff until max_attempts is reached.
+"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, Job
+
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE", "0") == "1"
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+
+def queue_enabled() -> bool:
+    return JOB_QUEUE_ENABLED
+
+
+# --- Producer side ---
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[Dict[str, Any]] = None,
+    dedupe_key: Optional[str] = None,
+    delay_seconds: float = 0,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> bool:
+    """Stage a job on `db`; the caller's commit makes it durable. Returns False if deduplicated."""
+    if dedupe_key is not None:
+        pending = [obj for obj in db.new if isinstance(obj, Job) and obj.dedupe_key == dedupe_key]
+        # Don't flush the caller's staged rows: that would take the write lock
+        # (SQLite) for the rest of their transaction, e.g. through an LLM call
+        with db.no_autoflush:
+            already_queued = pending or db.execute(
+                select(Job.id).where(Job.dedupe_key == dedupe_key, Job.status == "queued").limit(1)
+            ).first()
+        if already_queued:
+            return False
+    db.add(Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts,
+        run_after=datetime.utcnow() + timedelta(seconds=delay_seconds),
+    ))
+    return True
+
+
+def submit_job(kind: str, payload: Optional[Dict[str, Any]] = None, dedupe_key: Optional[str] = None, **kwargs) -> bool:
+    """enqueue() in its own session and transaction."""
+    db = SessionLocal()
+    try:
+        queued = enqueue(db, kind, payload, dedupe_key, **kwargs)
+        db.commit()
+        return queued
+    finally:
+        db.close()
+
+
+# --- Worker side ---
+def claim(worker_id: str, limit: int, kinds: Optional[List[str]] = None) -> list:
+    """Lease up to `limit` ready (or lease-expired) jobs to `worker_id`; returns rows (id, kind, payload, attempts, max_attempts)."""
+    now = datetime.utcnow()
+    ready = or_(
+        and_(Job.status == "queued", Job.run_after <= now),
+        and_(Job.status == "running", Job.lease_until < now),
+    )
+    candidates = select(Job.id).where(ready)
+    if kinds:
+        candidates = candidates.where(Job.kind.in_(kinds))
+    # SKIP LOCKED: concurrent workers on Postgres take disjoint jobs instead of waiting
+    candidates = candidates.order_by(Job.id).limit(limit).with_for_update(skip_locked=True)
+
+    db = SessionLocal()
+    try:
+        jobs = db.execute(
+            update(Job)
+            .where(Job.id.in_(candidates.scalar_subquery()), ready)
+            .values(
+                status="running",
+                locked_by=worker_id,
+                lease_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                attempts=Job.attempts + 1,
+            )
+            .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        return sorted(jobs, key=lambda job: job.id)
+    finally:
+        db.close()
+
+
+def renew(worker_id: str, job_ids: List[int]):
+    """Extend the lease of jobs this worker is still running."""
+    if not job_ids:
+        return
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.locked_by == worker_id, Job.status == "running")
+            .values(lease_until=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def complete(worker_id: str, job_ids: List[int]):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.locked_by == worker_id)
+            .values(status="done", finished_at=datetime.utcnow(), lease_until=None, last_error=None)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter: base * 2^(attempts-1), capped."""
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(worker_id: str, jobs: list, error: str):
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        for job in jobs:
+            values = {"last_error": error[:2000], "lease_until": None}
+            if job.attempts >= job.max_attempts:
+                values.update(status="failed", finished_at=now)
+            else:
+                values.update(status="queued", run_after=now + timedelta(seconds=retry_delay(job.attempts)))
+            db.execute(update(Job).where(Job.id == job.id, Job.locked_by == worker_id).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def prune_finished(older_than_hours: float = JOB_RETENTION_HOURS) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    db = SessionLocal()
+    try:
+        deleted = db.execute(
+            delete(Job).where(Job.status.in_(["done", "failed"]), Job.finished_at < cutoff)
+        ).rowcount
+        db.commit()
+        return deleted
+    finally:
+        db.close()
@@ -0,0 +1,63 @@
+import os
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.database import User
+from app.core.cache import SharedCache
+from app.core.metrics import CACHE_REQUESTS
+
+# Cached {"username", "full_name"} per user_id, so the chat hot path and
+# GET /me don't have to query the users table on every request.
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+profile_cache = SharedCache("profile", maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+
+def get_cached_profile(db: Session, user_id: int) -> Optional[dict]:
+    """Return the user's profile from the cache, loading it from the DB on a miss."""
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        CACHE_REQUESTS.inc(cache="profile", result="hit")
+        return profile
+    CACHE_REQUESTS.inc(cache="profile", result="miss")
+
+    # Don't flush rows the caller has staged just to read a profile
+    with db.no_autoflush:
+        user = db.query(User.username, User.full_name).filter(User.id == user_id).first()
+    if not user:
+        return None
+
+    profile = {"username": user.username, "full_name": user.full_name}
+    profile_cache.set(user_id, profile)
+    return profile
+
+
+def cache_profile(user_id: int, username: str, full_name: str):
+    profile_cache.set(user_id, {"username": username, "full_name": full_name})
+
+
+def invalidate_profile(user_id: int):
+    profile_cache.delete(user_id)
+
+
+# --- Logins ---
+# email -> [user_id, username] for repeated POST /auth/sync calls. Shared like the
+# profiles, so invalidate_login() reaches every worker; the TTL bounds staleness
+# after changes made where nobody invalidates (manual SQL, a full restore).
+LOGIN_CACHE_TTL = float(os.getenv("AUTH_EMAIL_CACHE_TTL_SECONDS", "300"))
+
+login_cache = SharedCache("login", maxsize=PROFILE_CACHE_SIZE, ttl=LOGIN_CACHE_TTL)
+
+
+def get_cached_login(email: str) -> Optional[list]:
+    return login_cache.get(email)
+
+
+def cache_login(email: str, user_id: int, username: str):
+    login_cache.set(email, [user_id, username])
+
+
+def invalidate_login(email: str):
+    login_cache.delete(email)
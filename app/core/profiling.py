@@ -0,0 +1,151 @@
+"""
+On-demand wall-clock profiling of single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_ADMIN_TOKEN>`, or
+when it is picked by PROFILE_SAMPLE_RATE (0.0-1.0). While it runs, a sampler
+thread snapshots the stacks of every thread in the process (including the
+worker threads LangChain and the HTTP clients start) every PROFILE_INTERVAL_MS,
+and the result is written to PROFILE_DIR as collapsed stacks ("folded" format,
+readable by flamegraph.pl and speedscope). The profile id is returned in the
+`X-Profile-Id` response header and can be downloaded from /admin/profiles.
+
+With neither setting configured the middleware is not installed at all.
+"""
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+MAX_CONCURRENT_PROFILES = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def is_admin(token: Optional[str]) -> bool:
+    # Compare bytes: compare_digest raises TypeError for non-ASCII str. Header values
+    # arrive latin-1 decoded, so encoding them back yields the bytes the client sent.
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode("latin-1", "replace"), PROFILE_ADMIN_TOKEN.encode("utf-8")
+    )
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads on a fixed interval."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def new_profile_id() -> str:
+    return f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(profiler: SamplingProfiler, profile_id: str, method: str, path: str, duration: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+        f.write(f"# {method} {path} duration={duration * 1000:.1f}ms samples={profiler.sample_count}\n")
+        f.write(profiler.folded())
+
+
+def list_profiles() -> List[str]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((name[:-len(".folded")] for name in os.listdir(PROFILE_DIR) if name.endswith(".folded")), reverse=True)
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    # Ids are generated by save_profile(); reject anything that could escape PROFILE_DIR
+    if not profile_id or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests selected by admin header or sampling."""
+
+    def __init__(self, app):
+        self.app = app
+        self._slots = threading.BoundedSemaphore(MAX_CONCURRENT_PROFILES)
+
+    def _should_profile(self, scope) -> bool:
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return True
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                return is_admin(value.decode("latin-1"))
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._slots.acquire(blocking=False):
+            # Enough profiles are already running; serve this one normally
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler()
+        profile_id = new_profile_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            # Joining the sampler and writing the file block; keep them off the event loop
+            await run_in_threadpool(profiler.stop)
+            self._slots.release()
+            await run_in_threadpool(save_profile, profiler, profile_id, scope.get("method", ""), scope.get("path", ""), elapsed)
+            print(f"[INFO] Saved request profile {profile_id} for {scope.get('method')} {scope.get('path')}")
@@ -0,0 +1,204 @@
+import asyncio
+import heapq
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.database import SessionLocal, Reminder
+
+# In-process due-reminder scheduler.
+# Upcoming reminders sit in a min-heap ordered by due_date; one thread sleeps
+# until the earliest one is due and pushes it to that user's connected clients
+# (see the SSE endpoint in app/routers/reminders.py). The heap is loaded
+# through the (is_completed, due_date) index and periodically re-synced, so
+# reminders written by other workers are picked up too.
+
+RESYNC_SECONDS = float(os.getenv("REMINDER_RESYNC_SECONDS", "60"))
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    # The app stores naive UTC datetimes
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ReminderScheduler:
+    def __init__(self, session_factory=SessionLocal, resync_seconds: float = RESYNC_SECONDS):
+        self._session_factory = session_factory
+        self._resync_seconds = resync_seconds
+        self._heap: List[Tuple[datetime, int]] = []
+        # reminder_id -> (due_date, user_id, content); heap items not matching this are stale
+        self._entries: Dict[int, Tuple[datetime, int, str]] = {}
+        # While a resync query runs: local schedule()/cancel() calls (None = cancelled),
+        # replayed over its result since the query may have read the rows before them
+        self._local_changes: Optional[Dict[int, Optional[Tuple[datetime, int, str]]]] = None
+        # Everything due up to this point has already been fired
+        self._fired_until = datetime.utcnow()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._subscribers_lock = threading.Lock()
+
+    # --- Lifecycle ---
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # --- Heap maintenance (called by the reminder endpoints after commit) ---
+    def schedule(self, reminder_id: int, user_id: int, content: str, due_date: Optional[datetime]):
+        if due_date is None:
+            self.cancel(reminder_id)
+            return
+        due_date = _to_naive_utc(due_date)
+        with self._cond:
+            self._entries[reminder_id] = (due_date, user_id, content)
+            if self._local_changes is not None:
+                self._local_changes[reminder_id] = self._entries[reminder_id]
+            heapq.heappush(self._heap, (due_date, reminder_id))
+            self._cond.notify_all()
+
+    def cancel(self, reminder_id: int):
+        with self._cond:
+            # Heap entry is dropped lazily when it reaches the top
+            self._entries.pop(reminder_id, None)
+            if self._local_changes is not None:
+                self._local_changes[reminder_id] = None
+
+    def cancel_many(self, reminder_ids):
+        with self._cond:
+            for reminder_id in reminder_ids:
+                self._entries.pop(reminder_id, None)
+                if self._local_changes is not None:
+                    self._local_changes[reminder_id] = None
+
+    def resync(self):
+        """Reload every pending reminder that has not fired yet."""
+        db = self._session_factory()
+        try:
+            with self._cond:
+                since = self._fired_until
+                self._local_changes = {}
+            rows = (
+                db.query(Reminder.id, Reminder.user_id, Reminder.content, Reminder.due_date)
+                .filter(Reminder.is_completed == False, Reminder.due_date > since)  # noqa: E712
+                .all()
+            )
+        except Exception:
+            with self._cond:
+                self._local_changes = None
+            raise
+        finally:
+            db.close()
+
+        entries = {row.id: (_to_naive_utc(row.due_date), row.user_id, row.content) for row in rows}
+        with self._cond:
+            # The database decides, except for what changed locally while the query ran
+            for reminder_id, entry in self._local_changes.items():
+                if entry is None:
+                    entries.pop(reminder_id, None)
+                else:
+                    entries[reminder_id] = entry
+            self._local_changes = None
+            # Whatever came due while the query ran has fired already
+            entries = {rid: entry for rid, entry in entries.items() if entry[0] > self._fired_until}
+            self._entries = entries
+            self._heap = [(entry[0], reminder_id) for reminder_id, entry in entries.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify_all()
+
+    # --- Push delivery ---
+    def subscribe(self, user_id: int, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        with self._subscribers_lock:
+            self._subscribers.setdefault(user_id, set()).add((loop, queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._subscribers_lock:
+            subscribers = self._subscribers.get(user_id, set())
+            for item in list(subscribers):
+                if item[1] is queue:
+                    subscribers.discard(item)
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id: int, event: dict):
+        with self._subscribers_lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                self.unsubscribe(user_id, queue)  # Event loop already closed
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass  # Slow client; the reminders list still has it
+
+    # --- Worker ---
+    def _pop_due(self, now: datetime):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_date, reminder_id = heapq.heappop(self._heap)
+            entry = self._entries.get(reminder_id)
+            if entry is None or entry[0] != due_date:
+                continue  # Cancelled or rescheduled
+            del self._entries[reminder_id]
+            due.append((reminder_id, entry))
+        self._fired_until = max(self._fired_until, now)
+        return due
+
+    def _run(self):
+        try:
+            self.resync()
+        except Exception as e:
+            print(f"[WARN] Reminder scheduler initial load failed: {e}")
+        next_resync = datetime.utcnow().timestamp() + self._resync_seconds
+
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = datetime.utcnow()
+                due = self._pop_due(now)
+                if not due:
+                    wait = next_resync - now.timestamp()
+                    if self._heap:
+                        wait = min(wait, (self._heap[0][0] - now).total_seconds())
+                    if wait > 0:
+                        self._cond.wait(wait)
+
+            for reminder_id, (due_date, user_id, content) in due:
+                self.publish(user_id, {
+                    "id": reminder_id,
+                    "content": content,
+                    "due_date": due_date.isoformat(),
+                })
+
+            if datetime.utcnow().timestamp() >= next_resync:
+                try:
+                    self.resync()
+                except Exception as e:
+                    print(f"[WARN] Reminder scheduler resync failed: {e}")
+                next_resync = datetime.utcnow().timestamp() + self._resync_seconds
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,57 @@
+"""
+Request coalescing ("single flight") for identical in-flight work.
+
+Concurrent calls with the same key share one execution: the first caller runs
+the function, later callers wait for and reuse its result (or its exception).
+Successful results are kept for a short window, so a retry that arrives just
+after the first request finished also gets the same answer instead of running
+the work again.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.core.cache import TTLCache
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, maxsize: int = 10_000):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._results = TTLCache(maxsize=maxsize)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], retain_seconds: float = 0) -> Tuple[Any, bool]:
+        """Run fn() once per key. Returns (result, shared) where shared is True for followers."""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached, True
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+            if retain_seconds > 0:
+                self._results.set(key, call.value, ttl=retain_seconds)
+            return call.value, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
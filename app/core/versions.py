@@ -0,0 +1,115 @@
+"""
+Version counters for conditional GETs (ETag / If-None-Match).
+
+Every cached read has a scope and a key: ("sessions", user_id), ("history", session_id),
+("memories", user_id), ("reminders", user_id). Write endpoints call bump() after
+they commit. GET endpoints derive their ETag from the counter *before* reading, and
+a request whose If-None-Match still matches gets a 304 without a database query.
+
+Counters live in Redis when REDIS_URL is configured (shared by every worker).
+Process-local counters are only correct with a single API process (a write served
+by worker A never bumps worker B's counter, and B would keep answering 304), so
+without Redis conditional GETs are off unless ETAG_LOCAL_COUNTERS=1 declares a
+single-process deployment.
+
+Writers outside the API process (memory consolidation from the CLI or from
+app.worker) can only bump shared counters, so they refuse to run unless
+shared() is true; otherwise clients would keep getting 304s for stale data.
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Hashable, Optional
+
+from fastapi import Request, Response
+
+from app.core.cache import get_redis
+
+ETAG_LOCAL_COUNTERS = os.getenv("ETAG_LOCAL_COUNTERS", "0") == "1"
+
+# Local counters restart at zero with the process; the nonce keeps old ETags from matching
+_PROCESS_NONCE = uuid.uuid4().hex[:8]
+
+
+class VersionCounters:
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(scope: str, key: Hashable) -> str:
+        return f"replimate:version:{scope}:{key}"
+
+    def current(self, scope: str, key: Hashable) -> Optional[str]:
+        """Opaque version string, or None if it cannot be determined (no caching then)."""
+        client = get_redis()
+        if client is None:
+            if not ETAG_LOCAL_COUNTERS:
+                return None
+            with self._lock:
+                return f"{_PROCESS_NONCE}.{self._counters.get((scope, key), 0)}"
+        try:
+            redis_key = self._key(scope, key)
+            value = client.get(redis_key)
+            if value is None:
+                # Start from a fresh epoch, so a counter that was lost never repeats an old value
+                client.set(redis_key, time.time_ns(), nx=True)
+                value = client.get(redis_key)
+            return value.decode() if isinstance(value, bytes) else str(value)
+        except Exception as e:
+            print(f"[WARN] Version counter read failed: {e}")
+            return None
+
+    def bump(self, scope: str, key: Hashable):
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                self._counters[(scope, key)] = self._counters.get((scope, key), 0) + 1
+            return
+        try:
+            redis_key = self._key(scope, key)
+            client.set(redis_key, time.time_ns(), nx=True)
+            client.incr(redis_key)
+        except Exception as e:
+            print(f"[WARN] Version counter bump failed: {e}")
+
+
+versions = VersionCounters()
+
+
+def shared() -> bool:
+    """True when bumps are seen by every process (Redis), not just this one."""
+    return get_redis() is not None
+
+
+def bump(scope: str, key: Hashable):
+    """Call after the write is committed."""
+    versions.bump(scope, key)
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are the same validator
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in if_none_match.split(","))
+
+
+def conditional_get(request: Request, response: Response, scope: str, key: Hashable) -> Optional[Response]:
+    """
+    Sets ETag and Cache-Control on `response`. Returns a 304 response if the
+    client's copy is current; the endpoint should return it without reading.
+    """
+    version = versions.current(scope, key)
+    if version is None:
+        return None
+    etag = f'W/"{scope}-{key}-{version}"'
+    # no-cache: browsers keep the body but revalidate with If-None-Match every time
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
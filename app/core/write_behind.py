@@ -0,0 +1,126 @@
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.database import SessionLocal, ChatHistory
+
+# Write-behind batching for ChatHistory rows.
+# Concurrent /chat requests hand their rows to a single writer thread, which
+# bulk-inserts everything that arrived within a short window and commits once
+# (group commit). Each request still blocks until its rows are committed, so a
+# response is never sent for a turn that is not durable.
+
+WRITE_BEHIND_ENABLED = os.getenv("CHAT_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+MAX_BATCH_ROWS = int(os.getenv("CHAT_WRITE_BEHIND_MAX_ROWS", "256"))
+MAX_DELAY_SECONDS = float(os.getenv("CHAT_WRITE_BEHIND_MAX_DELAY_MS", "10")) / 1000
+SUBMIT_TIMEOUT_SECONDS = 10.0
+
+
+class _PendingWrite:
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+
+class HistoryWriteBehind:
+    """Batches ChatHistory inserts from many requests into bulk inserts."""
+
+    def __init__(self, session_factory=SessionLocal, max_rows: int = MAX_BATCH_ROWS, max_delay: float = MAX_DELAY_SECONDS):
+        self._session_factory = session_factory
+        self._max_rows = max_rows
+        self._max_delay = max_delay
+        self._queue: "queue.Queue[Optional[_PendingWrite]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-write-behind", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def submit(self, rows: List[Dict], timeout: float = SUBMIT_TIMEOUT_SECONDS):
+        """Queue rows and block until the batch containing them is committed."""
+        if not rows:
+            return
+        self.start()
+        pending = _PendingWrite(rows)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Chat history write was not committed in time")
+        if pending.error is not None:
+            raise pending.error
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            row_count = len(first.rows)
+            stop_after = False
+            deadline = time.monotonic() + self._max_delay
+
+            # Gather more writes until the batch is full or the window closes
+            while row_count < self._max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop_after = True
+                    break
+                batch.append(item)
+                row_count += len(item.rows)
+
+            self._flush(batch)
+            if stop_after:
+                # Drain anything that raced in behind the stop marker
+                leftover = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        leftover.append(item)
+                if leftover:
+                    self._flush(leftover)
+                return
+
+    def _flush(self, batch: List[_PendingWrite]):
+        rows = [row for pending in batch for row in pending.rows]
+        db = self._session_factory()
+        error = None
+        try:
+            db.execute(insert(ChatHistory), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            error = e
+            print(f"[ERROR] Write-behind flush of {len(rows)} chat rows failed: {e}")
+        finally:
+            db.close()
+        for pending in batch:
+            pending.error = error
+            pending.done.set()
+
+
+history_writer = HistoryWriteBehind()
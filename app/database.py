@@ -1,11 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 import uuid
 
 import os
 from dotenv import load_dotenv
 
+from app.core.encryption import encode_content, decode_content
+
 load_dotenv()
 
 # Use environment variable or fallback to local SQLite
@@ -18,6 +21,7 @@ if DATABASE_URL.startswith("postgres://"):
 print(f"[DEBUG] Active Database URL: {DATABASE_URL.split('@')[-1] if '@' in DATABASE_URL else DATABASE_URL}")
 
 # Connect args: SQLite needs check_same_thread=False, Postgres does not
+# (create_engine() does not connect; the first connection is opened lazily)
 connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
 
 engine = create_engine(
@@ -28,6 +32,18 @@ SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
 
 
+class SealedText(TypeDecorator):
+    """Text column stored compressed and encrypted at rest (see app/core/encryption.py)."""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode_content(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_content(value)
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -51,14 +67,35 @@ class ChatHistory(Base):
     user_id = Column(Integer)
     session_id = Column(String, index=True) # Link to ChatSession
     role = Column(String)
-    content = Column(Text)
+    content = Column(SealedText)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+class ArchivedSession(Base):
+    """Where an idle session's history lives after it was moved to cold storage (app/core/archive.py)."""
+    __tablename__ = "archived_sessions"
+    session_id = Column(String, primary_key=True)
+    user_id = Column(Integer, index=True)
+    segment = Column(String)  # Segment file name inside ARCHIVE_DIR
+    offset = Column(Integer)
+    length = Column(Integer)
+    row_count = Column(Integer)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
 class UserMemory(Base):
     __tablename__ = "user_memory"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer)
-    content = Column(Text)
+    content = Column(SealedText)
+
+class MemoryProvenance(Base):
+    # Original memories merged into a canonical one by app/core/consolidation.py
+    __tablename__ = "memory_provenance"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    canonical_id = Column(Integer, index=True)  # UserMemory that replaced the source
+    source_id = Column(Integer)  # Deleted UserMemory id
+    source_content = Column(SealedText)
+    consolidated_at = Column(DateTime, default=datetime.utcnow)
 
 class Reminder(Base):
     __tablename__ = "reminders"
@@ -69,10 +106,49 @@ class Reminder(Base):
     is_completed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Lets the reminder scheduler load pending, upcoming reminders without a table scan
+    __table_args__ = (Index("ix_reminders_pending_due", "is_completed", "due_date"),)
+
+class Job(Base):
+    # Durable background work, run by `python -m app.worker` (see app/core/jobs.py)
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String)
+    payload = Column(Text, default="{}")  # JSON
+    dedupe_key = Column(String, nullable=True, index=True)  # At most one queued job per key
+    status = Column(String, default="queued")  # queued | running | done | failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
 
+    # Claiming scans ready jobs in order
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
 
 
-Base.metadata.create_all(bind=engine)
+
+_db_initialized = False
+
+
+def init_db():
+    """
+    Create missing tables and indexes. Runs once per process, from the app
+    lifespan (or a script's entry point) rather than at import time.
+    """
+    global _db_initialized
+    if _db_initialized:
+        return
+    Base.metadata.create_all(bind=engine)
+
+    # create_all() skips new indexes on tables that already exist, so add them explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    _db_initialized = True
 
 
 def get_db():
@@ -83,13 +159,33 @@ def get_db():
         db.close()
 
 
-def get_all_memories():
-    """Retrieve all user memories from the database locally for RAG loading."""
-    db = SessionLocal()
-    try:
-        memories = db.query(UserMemory).all()
-        return [m.content for m in memories]
-    finally:
-        db.close()
+def iter_memory_rows(batch_size: int = 500):
+    """
+    Stream (id, user_id, content) memory rows for RAG loading.
+    Only the needed columns are selected, and rows are read `batch_size` at a
+    time with keyset pages (id > last id), so memory stays flat as the table grows.
+    Each page is read in its own short session and fully fetched before it is
+    yielded: no cursor or transaction (on SQLite, no read lock) stays open while
+    the caller embeds a batch over the network.
+    """
+    last_id = None
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(UserMemory.id, UserMemory.user_id, UserMemory.content)
+            if last_id is not None:
+                query = query.filter(UserMemory.id > last_id)
+            page = query.order_by(UserMemory.id).limit(batch_size).all()
+        finally:
+            db.close()
+        if not page:
+            return
+        yield from page
+        if len(page) < batch_size:
+            return
+        last_id = page[-1].id
 
 
+def get_all_memories():
+    """Retrieve all user memories from the database locally for RAG loading."""
+    return [row.content for row in iter_memory_rows()]
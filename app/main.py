@@ -1,32 +1,93 @@
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
+import os
 
-from app.routers import auth, chat, users, reminders
+from app.database import init_db
+from app.routers import auth, chat, users, reminders, metrics, admin
+from app.core.write_behind import history_writer
+from app.core.scheduler import reminder_scheduler
+from app.core.consolidation import consolidation_scheduler, out_of_process_ready
+from app.core.jobs import queue_enabled
+from app.rag import index_store
+from app.core.metrics import ServerTimingMiddleware
+from app.core.profiling import ProfilingMiddleware, profiling_enabled
+from app.core.admission import AdmissionRejected, apply_threadpool_size
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Load RAG
+    # Startup: schema check runs once here, not at import time
+    init_db()
+    # Sync endpoints run on this many threads; the LLM queue bound is derived from it
+    apply_threadpool_size()
+    # Load RAG
     # reload_rag()  <-- Disable to speed up boot time for Render (Lazy load instead)
+    # Push due reminders to connected clients (loads pending reminders in its own thread)
+    reminder_scheduler.start()
+    if queue_enabled() and not index_store.shared_mode():
+        print("[WARN] JOB_QUEUE=1 without RAG_INDEX_MODE=shared: index rebuilds stay in this process.")
+    # Periodic memory consolidation (off unless CONSOLIDATION_INTERVAL_HOURS is set);
+    # `python -m app.worker` schedules it instead when it can publish the results
+    if not (queue_enabled() and out_of_process_ready()):
+        consolidation_scheduler.start()
     yield
-    # Shutdown
+    consolidation_scheduler.stop()
+    reminder_scheduler.stop()
+    # Shutdown: commit any chat rows still waiting in the write-behind queue
+    history_writer.stop()
 
 app = FastAPI(title="RepliMate – AI with Memory", lifespan=lifespan)
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # Rate limited or LLM queue full: fail fast and tell the client when to retry
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id", "Retry-After", "ETag"],
 )
 
+# Compress larger responses: brotli if brotli-asgi is installed, gzip otherwise.
+# The reminder SSE stream must not be buffered: gzip skips text/event-stream
+# by itself, and the route is excluded from brotli explicitly.
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1000"))
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        BrotliMiddleware,
+        minimum_size=COMPRESS_MIN_BYTES,
+        gzip_fallback=True,
+        excluded_handlers=[r"^/reminders/.+/stream$"],
+    )
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+
+# Per-stage timings for every request (Server-Timing header + /metrics histograms)
+app.add_middleware(ServerTimingMiddleware)
+
+# Opt-in request profiling (X-Profile header or PROFILE_SAMPLE_RATE); not installed unless configured
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
 # Routers
 app.include_router(auth.router)
 app.include_router(chat.router)
 app.include_router(users.router)
 app.include_router(reminders.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 # Note: We no longer serve static files from here since we use React on a separate port.
 # If we wanted to serve the built React app, we would mount it here.
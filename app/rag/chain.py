@@ -1,19 +1,79 @@
 import os
+import time
 from dotenv import load_dotenv
 
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 
+from app.core.metrics import timed, record_stage, LLM_TOKENS
+
 
 load_dotenv()  
 
 
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Records LLM latency (stage `llm_<call>`) and token usage for one call site."""
+
+    def __init__(self, call: str):
+        self.call = call
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            record_stage(f"llm_{self.call}", time.perf_counter() - start)
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+        except (IndexError, AttributeError):
+            usage = {}
+        if usage:
+            LLM_TOKENS.inc(usage.get("input_tokens", 0), call=self.call, kind="input")
+            LLM_TOKENS.inc(usage.get("output_tokens", 0), call=self.call, kind="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+
+def retrieve_documents(vectorstore, question, user_id, k_user=3, k_global=2):
+    """
+    Top `k_user` memories for the user plus top `k_global` global (user_id=-1) ones.
+    Used by the RAG chain and by scripts/bench_retrieval.py.
+    """
+    # FAISS doesn't support "OR" logic in simple filter dict usually.
+    # LangChain FAISS `filter` argument usually maps to exact match on metadata fields.
+    # Workaround: Retrieve top K for user AND top K for global, then combine.
+
+    # Embed the question once and reuse it for both searches
+    embedding = vectorstore.embeddings.embed_query(question)
+
+    # 1. User Specific (Dynamic Memories)
+    # Only apply filter if user_id is provided and valid
+    docs_user = []
+    with timed("faiss_search"):
+        if user_id:
+            # Metadata saved user_id as it was (int).
+            docs_user = vectorstore.similarity_search_by_vector(embedding, k=k_user, filter={"user_id": int(user_id)})
+
+        # 2. Global (System Memories / Story)
+        docs_global = vectorstore.similarity_search_by_vector(embedding, k=k_global, filter={"user_id": -1})
+
+    return docs_user, docs_global
+
+
 def build_rag_chain(vectorstore):
     llm = ChatGoogleGenerativeAI(
         model="models/gemini-2.5-flash",
         temperature=0.3,
-        api_key=os.getenv("GOOGLE_API_KEY")  # 👈 explicit key
+        api_key=os.getenv("GOOGLE_API_KEY"),  # 👈 explicit key
+        callbacks=[LLMMetricsHandler("generate")]
     )
 
     prompt = ChatPromptTemplate.from_template(
@@ -33,29 +93,8 @@ def build_rag_chain(vectorstore):
     )
 
     def retrieve_context(question, user_id):
-        # Perform similarity search with metadata filtering
-        # We want docs that match user_id OR are global (user_id=-1)
-        # FAISS doesn't support "OR" logic in simple filter dict usually.
-        # We might need to fetch separately or use a custom filter function if supported.
-        # LangChain FAISS `filter` argument usually maps to exact match on metadata fields.
-        
-        # Simple approach: Fetch for user specifically.
-        # Problem: Losing global context (file).
-        # Workaround: Retrieve top K for user AND top K for global, then combine.
-        
         try:
-            # 1. User Specific (Dynamic Memories)
-            # The filter format depends on the vectorstore implementation.
-            # Only apply filter if user_id is provided and valid
-            docs_user = []
-            if user_id: 
-                 # Convert integer if needed, but metadata saved it as it was (int).
-                 # FAISS in LangChain typically supports basic dict filtering.
-                 docs_user = vectorstore.similarity_search(question, k=3, filter={"user_id": int(user_id)})
-            
-            # 2. Global (System Memories / Story)
-            docs_global = vectorstore.similarity_search(question, k=2, filter={"user_id": -1})
-            
+            docs_user, docs_global = retrieve_documents(vectorstore, question, user_id)
             # Combine and Deduplicate
             all_docs = docs_user + docs_global
             return "\n".join(doc.page_content for doc in all_docs)
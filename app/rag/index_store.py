@@ -0,0 +1,235 @@
+"""
+Versioned on-disk FAISS index shared by every worker (RAG_INDEX_MODE=shared).
+
+Layout under RAG_INDEX_DIR:
+    v<version>/index.faiss   vectors, memory-mapped read-only by every worker
+    v<version>/docs.sqlite   document text (sealed) + metadata, read on demand
+    CURRENT                  name of the newest published version (atomic replace)
+    REQUESTED                touched whenever a rebuild is wanted
+    build.lock               held by the one worker currently rebuilding
+
+One worker builds and publishes a new version; the others notice CURRENT has
+changed (checked at most every RAG_INDEX_CHECK_SECONDS) and swap to it. Since
+vectors are mmapped (IO_FLAG_MMAP_IFC) and documents are looked up on demand,
+every worker reads the same page-cache copy of the index and per-worker private
+memory stays flat as the number of workers grows.
+
+LangChain and FAISS are only imported inside the functions that need them.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Optional
+
+from app.core.encryption import encode_content, decode_content
+
+INDEX_MODE = os.getenv("RAG_INDEX_MODE", "local")
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "data/index")
+CHECK_INTERVAL_SECONDS = float(os.getenv("RAG_INDEX_CHECK_SECONDS", "1"))
+KEEP_VERSIONS = int(os.getenv("RAG_INDEX_KEEP_VERSIONS", "3"))
+
+CURRENT_FILE = os.path.join(INDEX_DIR, "CURRENT")
+REQUESTED_FILE = os.path.join(INDEX_DIR, "REQUESTED")
+LOCK_FILE = os.path.join(INDEX_DIR, "build.lock")
+
+
+def shared_mode() -> bool:
+    return INDEX_MODE == "shared"
+
+
+# --- Change signal ---
+_check_lock = threading.Lock()
+_last_check = 0.0
+_last_mtime = None
+_cached_version: Optional[str] = None
+
+
+def read_current_version() -> Optional[str]:
+    """Name of the newest published version (a stat() at most every CHECK_INTERVAL_SECONDS)."""
+    global _last_check, _last_mtime, _cached_version
+    now = time.monotonic()
+    if now - _last_check < CHECK_INTERVAL_SECONDS:
+        return _cached_version
+    with _check_lock:
+        _last_check = now
+        try:
+            mtime = os.stat(CURRENT_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != _last_mtime:
+            with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+                _cached_version = f.read().strip() or None
+            _last_mtime = mtime
+        return _cached_version
+
+
+def request_rebuild():
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(REQUESTED_FILE, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+def rebuild_requested_since(timestamp: float) -> bool:
+    try:
+        return os.stat(REQUESTED_FILE).st_mtime > timestamp
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def build_lock():
+    """Non-blocking cross-process lock; yields True if this process may build."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    f = open(LOCK_FILE, "a+")
+    acquired = False
+    try:
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except OSError:
+            acquired = False
+        yield acquired
+    finally:
+        if acquired:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+# --- Publish ---
+def publish(vectorstore) -> str:
+    """Write a built in-memory FAISS store as a new version and make it current."""
+    import faiss
+
+    version = f"v{time.time_ns()}"
+    final_dir = os.path.join(INDEX_DIR, version)
+    tmp_dir = final_dir + ".tmp"
+    os.makedirs(tmp_dir)
+
+    faiss.write_index(vectorstore.index, os.path.join(tmp_dir, "index.faiss"))
+
+    conn = sqlite3.connect(os.path.join(tmp_dir, "docs.sqlite"))
+    try:
+        conn.execute("CREATE TABLE docs (pos INTEGER PRIMARY KEY, doc_id TEXT, content TEXT, metadata TEXT)")
+        batch = []
+        for pos, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+            doc = vectorstore.docstore.search(doc_id)
+            batch.append((pos, doc_id, encode_content(doc.page_content), json.dumps(doc.metadata)))
+            if len(batch) >= 1000:
+                conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_dir, final_dir)
+
+    # Atomically point CURRENT at the new version
+    tmp_current = CURRENT_FILE + ".tmp"
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_current, CURRENT_FILE)
+
+    _prune_old_versions(keep=version)
+    print(f"[INFO] Published shared RAG index {version} ({vectorstore.index.ntotal} vectors)")
+    return version
+
+
+def _prune_old_versions(keep: str):
+    import shutil
+
+    versions = sorted(
+        (name for name in os.listdir(INDEX_DIR) if name.startswith("v") and not name.endswith(".tmp")),
+        reverse=True,
+    )
+    # Workers still mapping an old version keep their open file handles
+    for name in versions[KEEP_VERSIONS:]:
+        if name != keep:
+            shutil.rmtree(os.path.join(INDEX_DIR, name), ignore_errors=True)
+
+
+# --- Load ---
+class _PositionIds(Mapping):
+    """index_to_docstore_id for a published version: position i maps to docstore key str(i)."""
+
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, i):
+        if not 0 <= int(i) < self._size:
+            raise KeyError(i)
+        return str(int(i))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+
+class SqliteDocstore:
+    """Read-only docstore that fetches documents from a version's docs.sqlite on demand."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def search(self, search: str):
+        from langchain_core.documents import Document
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, content, metadata FROM docs WHERE pos = ?", (int(search),)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        doc_id, content, metadata = row
+        return Document(page_content=decode_content(content), metadata=json.loads(metadata), id=doc_id)
+
+
+def load_version(version: str, embeddings):
+    """Open a published version read-only: vectors via mmap, documents on demand."""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    version_dir = os.path.join(INDEX_DIR, version)
+    index_path = os.path.join(version_dir, "index.faiss")
+    # IO_FLAG_MMAP only maps IVF inverted lists; the flat index built here needs
+    # IO_FLAG_MMAP_IFC (older faiss lacks it) to map its vectors instead of copying them
+    flags = [faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY]
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        flags.insert(0, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    for flag in flags:
+        try:
+            index = faiss.read_index(index_path, flag)
+            break
+        except RuntimeError:
+            continue
+    else:
+        # Index types without mmap support are read into memory
+        index = faiss.read_index(index_path)
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=SqliteDocstore(os.path.join(version_dir, "docs.sqlite")),
+        index_to_docstore_id=_PositionIds(index.ntotal),
+    )
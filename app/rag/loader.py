@@ -1,25 +1,35 @@
 from langchain_core.documents import Document
-from app.database import SessionLocal, UserMemory
+from app.database import iter_memory_rows
 import os
 
-def load_user_memory():
-    """Load memories from SQL database and local text file, then convert to Documents with metadata."""
-    documents = []
-    
+# Number of Documents handed to the embedding/index stage at a time
+MEMORY_BATCH_SIZE = 256
+
+def memory_doc_id(memory_id: int) -> str:
+    return f"mem-{memory_id}"
+
+def iter_memory_batches(batch_size: int = MEMORY_BATCH_SIZE):
+    """
+    Stream memories from the SQL database and local text file as fixed-size
+    lists of Documents with metadata, so index builds never hold the whole table.
+    """
+    batch = []
+    yielded_any = False
+
     # 1. Load from SQL (User-Specific)
-    db = SessionLocal()
-    try:
-        memories = db.query(UserMemory).all()
-        for m in memories:
-            # Metadata is crucial for filtering later
-            doc = Document(
-                page_content=m.content,
-                metadata={"user_id": m.user_id, "source": "db"}
-            )
-            documents.append(doc)
-    finally:
-        db.close()
-    
+    for row in iter_memory_rows(batch_size):
+        # Metadata is crucial for filtering later
+        # The stable id lets single memories be replaced or removed in a live index
+        batch.append(Document(
+            page_content=row.content,
+            metadata={"user_id": row.user_id, "source": "db"},
+            id=memory_doc_id(row.id),
+        ))
+        if len(batch) >= batch_size:
+            yield batch
+            yielded_any = True
+            batch = []
+
     # 2. Load from user_memory.txt (Generic/Shared)
     # If this is "Raju's Story" and meant for everyone, we might tag it with user_id=None or "all"
     # But usually, if it's user specific, we shouldn't load it for all.
@@ -39,15 +49,21 @@ def load_user_memory():
                 if file_content:
                     doc = Document(
                         page_content=file_content,
-                        metadata={"user_id": -1, "source": "file"} # -1 = Global
+                        metadata={"user_id": -1, "source": "file"}, # -1 = Global
+                        id="file-user-memory",
                     )
-                    documents.append(doc)
+                    batch.append(doc)
         except Exception as e:
             print(f"[ERROR] Could not read {file_path}: {e}")
 
     # If no memories, provide a default one
-    if not documents:
-        documents = [Document(page_content="System initialized.", metadata={"user_id": -1})]
+    if not batch and not yielded_any:
+        batch = [Document(page_content="System initialized.", metadata={"user_id": -1}, id="system-init")]
+
+    if batch:
+        yield batch
 
-    return documents
+def load_user_memory():
+    """Load memories from SQL database and local text file, then convert to Documents with metadata."""
+    return [doc for batch in iter_memory_batches() for doc in batch]
 
@@ -1,23 +1,40 @@
 import os
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import FAISS
 
+from app.core.metrics import timed
+
 load_dotenv()
 
 # Use Google's embedding API instead of local HuggingFace model
 # This uses near-zero RAM (API call) vs ~400MB for torch + sentence-transformers
 _embeddings = None
 
+class TimedEmbeddings(Embeddings):
+    """Delegates to another embedder and records how long each call takes."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts):
+        with timed("embed_documents"):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with timed("embed_query"):
+            return self.inner.embed_query(text)
+
 def _get_embeddings():
     global _embeddings
     if _embeddings is None:
         api_key = os.getenv("GOOGLE_API_KEY", "").strip()
         print("[INFO] Initializing Google Embedding API...")
-        _embeddings = GoogleGenerativeAIEmbeddings(
+        _embeddings = TimedEmbeddings(GoogleGenerativeAIEmbeddings(
             model="models/gemini-embedding-001",
             google_api_key=api_key
-        )
+        ))
         print("[SUCCESS] Google Embedding API ready.")
     return _embeddings
 
@@ -30,3 +47,19 @@ def create_vector_store(documents):
     )
 
     return vectorstore
+
+def create_vector_store_from_batches(batches):
+    """
+    Build the FAISS index batch by batch: each batch of Documents is embedded
+    and added before the next one is loaded, so only one batch is in flight.
+    """
+    embeddings = _get_embeddings()
+    vectorstore = None
+
+    for batch in batches:
+        if vectorstore is None:
+            vectorstore = FAISS.from_documents(documents=batch, embedding=embeddings)
+        else:
+            vectorstore.add_documents(batch)
+
+    return vectorstore
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse
+from typing import Optional
+
+from app.core.profiling import is_admin, list_profiles, profile_path
+
+router = APIRouter()
+
+# --- Helpers ---
+def _require_admin(token: Optional[str]):
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# --- Endpoints ---
+
+@router.get("/admin/profiles")
+def get_profiles(x_admin_token: Optional[str] = Header(None)):
+    """List saved request profiles, newest first."""
+    _require_admin(x_admin_token)
+    return {"profiles": list_profiles()}
+
+@router.get("/admin/profiles/{profile_id}")
+def download_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Download a profile as collapsed stacks (flamegraph.pl / speedscope input)."""
+    _require_admin(x_admin_token)
+    path = profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
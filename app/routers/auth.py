@@ -1,12 +1,15 @@
-
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import insert, literal_column
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
 import uuid
 
 from app.database import get_db, User
-from app.auth import hash_password
+from app.auth import EXTERNAL_AUTH_MARKER
+from app.core.profiles import cache_profile, cache_login, get_cached_login
+from app.core.metrics import CACHE_REQUESTS
 
 router = APIRouter()
 
@@ -16,6 +19,55 @@ class UserSyncRequest(BaseModel):
     username: Optional[str] = None
     full_name: Optional[str] = None
 
+# --- Helpers ---
+def _upsert_user(db: Session, values: dict):
+    """
+    INSERT ... ON CONFLICT (email) DO UPDATE ... RETURNING id, username, inserted:
+    one statement that returns the new user or the existing one with that email.
+    Raises IntegrityError if only the username is taken.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        # xmax is 0 only for a row version this statement inserted
+        inserted = literal_column("(xmax = 0)")
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        inserted = None
+    else:
+        dialect_insert = inserted = None
+
+    if dialect_insert is None:
+        # Generic fallback: plain insert, look the user up if the email already exists
+        try:
+            row = db.execute(insert(User).values(**values).returning(User.id, User.username)).first()
+            db.commit()
+            return row, True
+        except IntegrityError:
+            db.rollback()
+            row = db.query(User.id, User.username).filter(User.email == values["email"]).first()
+            if row is None:
+                raise
+            return row, False
+
+    if inserted is None:
+        # SQLite cannot tell an upsert's insert from its update: DO NOTHING + RETURNING
+        # yields a row only when it inserted, otherwise read the existing one by email
+        row = db.execute(dialect_insert(User).values(**values).on_conflict_do_nothing(
+            index_elements=[User.email]
+        ).returning(User.id, User.username)).first()
+        db.commit()
+        if row is not None:
+            return row, True
+        return db.query(User.id, User.username).filter(User.email == values["email"]).first(), False
+
+    stmt = dialect_insert(User).values(**values)
+    # No-op update, so the conflicting row is locked and returned
+    stmt = stmt.on_conflict_do_update(index_elements=[User.email], set_={"email": stmt.excluded.email})
+    row = db.execute(stmt.returning(User.id, User.username, inserted.label("inserted"))).first()
+    db.commit()
+    return row, bool(row.inserted)
+
 # --- Endpoints ---
 
 @router.post("/auth/sync")
@@ -25,44 +77,40 @@ def sync_user(data: UserSyncRequest, db: Session = Depends(get_db)):
     Returns the local Integer 'user_id' needed for session management.
     And 'is_new_user' flag to trigger onboarding.
     """
-    user = db.query(User).filter(User.email == data.email).first()
+    cached = get_cached_login(data.email)
+    CACHE_REQUESTS.inc(cache="email", result="hit" if cached else "miss")
+    if cached:
+        user_id, username = cached
+        return {"message": "User synced", "user_id": user_id, "username": username, "is_new_user": False}
+
+    # If username not provided (e.g. from generic email login), generate one
+    username = data.username or data.email.split("@")[0]
     is_new = False
-    
-    if not user:
-        is_new = True
-        # Create new user in local DB
-        # If username not provided (e.g. from generic email login), generate one
-        username = data.username or data.email.split("@")[0]
-        
-        # Ensure username uniqueness
-        if db.query(User).filter(User.username == username).first():
-            username = f"{username}_{uuid.uuid4().hex[:4]}"
+    user = None
 
-        # Create user with random password (auth is handled by Supabase)
-        new_user = User(
-            username=username,
-            email=data.email,
-            password=hash_password(str(uuid.uuid4())), # Dummy password
-            full_name=data.full_name or ""
-        )
-        db.add(new_user)
+    for _ in range(3):
+        # Auth is handled by Supabase, so no password hash is computed.
         try:
-            db.commit()
-            db.refresh(new_user)
-            user = new_user
-        except Exception:
+            user, is_new = _upsert_user(db, {
+                "username": username,
+                "email": data.email,
+                "password": EXTERNAL_AUTH_MARKER,
+                "full_name": data.full_name or "",
+            })
+        except IntegrityError:
             db.rollback()
-            # Race condition: User was created by another request in parallel
-            user = db.query(User).filter(User.email == data.email).first()
-            if not user:
-                # If still not found, it might be the username unique constraint. Try again with random username.
-                new_user.username = f"{new_user.username}_{uuid.uuid4().hex[:4]}"
-                db.add(new_user)
-                db.commit()
-                db.refresh(new_user)
-                user = new_user
-            else:
-                is_new = False
+            # The conflict was on the username, not the email: retry with a suffix
+            username = f"{username}_{uuid.uuid4().hex[:4]}"
+            continue
+        if user and is_new:
+            # Replaces anything cached under this id (e.g. from before a DB reset)
+            cache_profile(user.id, user.username, data.full_name or "")
+        break
+
+    if not user:
+        raise HTTPException(status_code=409, detail="Could not create user")
+
+    cache_login(data.email, user.id, user.username)
 
     return {
         "message": "User synced", 
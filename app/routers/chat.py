@@ -1,37 +1,166 @@
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from sqlalchemy import Text, type_coerce
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone
 
-from app.database import get_db, User, ChatSession, ChatHistory, UserMemory, Reminder
-from app.rag.loader import load_user_memory
-from app.rag.vectorstore import create_vector_store
-from app.rag.chain import build_rag_chain
+from app.database import get_db, SessionLocal, ChatSession, ChatHistory, ArchivedSession, UserMemory, Reminder
+from app.core.write_behind import history_writer, WRITE_BEHIND_ENABLED
+from app.core.scheduler import reminder_scheduler
+from app.core.profiles import get_cached_profile
+from app.core.encryption import decode_many
+from app.core.archive import restore_session
+from app.core.metrics import timed, RAG_REBUILD_SECONDS, RAG_REBUILDS, RAG_INDEX_SIZE
+from app.rag import index_store
+from app.core.admission import chat_rate_limiter, llm_queue, AdmissionRejected
+from app.core.singleflight import SingleFlight
+from app.core.versions import bump, conditional_get
+from app.core.jobs import queue_enabled, enqueue, submit_job
+import asyncio
 import json
 import os 
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+import time
 from dateutil import parser
 
+# LangChain, Gemini and FAISS are imported inside the functions that need them,
+# so importing this router (and app.main) stays fast for cold starts.
+
 router = APIRouter()
 
 # --- RAG STATE ---
 # Quick local state for MVP refactor. Ideally this is in a singleton class.
+# Keys: "chain", "vectorstore" and, in shared index mode, the loaded "version".
 rag_components: Dict[str, Any] = {}
+_rag_swap_lock = threading.Lock()
+
+def _install_rag(vectorstore, version: Optional[str] = None):
+    from app.rag.chain import build_rag_chain
+
+    chain = build_rag_chain(vectorstore)
+    rag_components["vectorstore"] = vectorstore
+    rag_components["chain"] = chain
+    rag_components["version"] = version
+    RAG_INDEX_SIZE.set(vectorstore.index.ntotal)
+
+def _build_vectorstore():
+    from app.rag.loader import iter_memory_batches
+    from app.rag.vectorstore import create_vector_store_from_batches
+
+    return create_vector_store_from_batches(iter_memory_batches())
+
+def _rebuild_shared_index() -> bool:
+    """
+    Shared mode: build and publish a new index version, unless another worker
+    is already building (it will see our request and build again after).
+    Returns False if the build was left to another worker.
+    """
+    index_store.request_rebuild()
+    with index_store.build_lock() as acquired:
+        if not acquired:
+            print("[INFO] Another worker is rebuilding the shared RAG index.")
+            return False
+        while True:
+            started = time.time()
+            index_store.publish(_build_vectorstore())
+            # Rebuild again if memories changed while we were building
+            if not index_store.rebuild_requested_since(started):
+                break
+    refresh_rag()
+    return True
+
+def refresh_rag():
+    """Shared mode: switch to the newest published index version if this worker is behind."""
+    version = index_store.read_current_version()
+    if not version or version == rag_components.get("version"):
+        return
+    with _rag_swap_lock:
+        if version == rag_components.get("version"):
+            return
+        from app.rag.vectorstore import _get_embeddings
+
+        _install_rag(index_store.load_version(version, _get_embeddings()), version)
+        print(f"[INFO] Loaded shared RAG index {version}")
+
+def index_memories(user_id: int, memories) -> bool:
+    """
+    Embed and add freshly inserted (id, content) memories to the live local index.
+    Returns False when that isn't possible (no index yet, or shared mode where
+    the index is read-only) and the caller should schedule reload_rag instead.
+    """
+    return update_memory_index(user_id, added=memories)
+
+def update_memory_index(user_id: int, added=(), removed_ids=()) -> bool:
+    """
+    Apply memory changes to the live local index by document id: drop
+    `removed_ids` and embed/add the `added` (id, content) pairs. Same return
+    contract as index_memories().
+    """
+    if index_store.shared_mode() or "vectorstore" not in rag_components:
+        return False
+    from langchain_core.documents import Document
+    from app.rag.loader import memory_doc_id
+
+    with _rag_swap_lock:
+        vectorstore = rag_components["vectorstore"]
+        present = set(vectorstore.index_to_docstore_id.values())
+        # A rebuild that ran after the commit may already hold some of these
+        stale = [memory_doc_id(i) for i in removed_ids if memory_doc_id(i) in present]
+        documents = [
+            Document(page_content=content, metadata={"user_id": user_id, "source": "db"}, id=memory_doc_id(memory_id))
+            for memory_id, content in added
+            if memory_doc_id(memory_id) not in present
+        ]
+        if stale:
+            vectorstore.delete(stale)
+        if documents:
+            vectorstore.add_documents(documents)
+        RAG_INDEX_SIZE.set(vectorstore.index.ntotal)
+    return True
 
 def reload_rag():
     print("[INFO] Reloading RAG Memory...")
+    start = time.perf_counter()
     try:
-        docs = load_user_memory()
-        vectorstore = create_vector_store(docs)
-        chain = build_rag_chain(vectorstore)
-        rag_components["chain"] = chain
+        if index_store.shared_mode():
+            if not _rebuild_shared_index():
+                return
+        else:
+            _install_rag(_build_vectorstore())
+        RAG_REBUILD_SECONDS.observe(time.perf_counter() - start)
+        RAG_REBUILDS.inc(result="success")
         print("[SUCCESS] RAG Memory Reloaded!")
     except Exception as e:
+        RAG_REBUILDS.inc(result="failure")
         print(f"[WARN] RAG Reload failed (empty memory?): {e}")
 
+def defer_rag_reload(db: Optional[Session], schedule):
+    """
+    Ask for an index rebuild that runs after the caller's writes are committed.
+    With the job queue on (shared index mode), this stages a durable job on `db`
+    for app.worker, or submits one if db is None. Otherwise it calls
+    `schedule(reload_rag)`, e.g. BackgroundTasks.add_task.
+    """
+    if queue_enabled() and index_store.shared_mode():
+        if db is None:
+            submit_job("reload_rag", dedupe_key="reload_rag")
+        else:
+            enqueue(db, "reload_rag", dedupe_key="reload_rag")
+    else:
+        schedule(reload_rag)
+
+# --- Request coalescing ---
+# Identical in-flight /chat requests (double submits, client retries) share one turn.
+# Without a client key nothing is replayed once the turn finishes: sending "ok"
+# twice in a row is two turns.
+chat_flights = SingleFlight()
+# How long a finished turn is replayed for a client-supplied Idempotency-Key
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "600"))
+
 # Initial load
 # reload_rag() # Can't do at import time easily, do at startup
 
@@ -65,17 +194,26 @@ def extract_learning(sentence: str):
 
 def process_ai_reminder(user_id: int, question: str, db: Session):
     """
-    Uses LLM to extract reminder details and adds to DB.
-    Returns response string if successful, else None.
+    Uses LLM to extract reminder details and stages it on the session.
+    The caller commits it together with the rest of the chat turn.
+    Returns (response string, Reminder) if successful, else (None, None).
     """
     triggers = ["remind me", "set a reminder", "add reminder", "remind"]
     if not any(question.lower().startswith(t) for t in triggers):
-        return None
+        return None, None
 
     print(f"[INFO] Detecting Reminder Intent: {question}")
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from app.rag.chain import LLMMetricsHandler
     
     # specialized prompt
-    llm = ChatGoogleGenerativeAI(model="models/gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY"), temperature=0)
+    llm = ChatGoogleGenerativeAI(
+        model="models/gemini-2.5-flash",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0,
+        callbacks=[LLMMetricsHandler("reminder_extract")]
+    )
     
     current_time = datetime.utcnow().isoformat()
     
@@ -92,7 +230,8 @@ def process_ai_reminder(user_id: int, question: str, db: Session):
     """
     
     try:
-        response = llm.invoke(prompt)
+        with llm_queue.slot(user_id):
+            response = llm.invoke(prompt)
         # cleanup markdown code blocks if any
         text = response.content.replace("```json", "").replace("```", "").strip()
         data = json.loads(text)
@@ -109,7 +248,6 @@ def process_ai_reminder(user_id: int, question: str, db: Session):
             
             reminder = Reminder(user_id=user_id, content=content, due_date=due_date)
             db.add(reminder)
-            db.commit()
             
             # Friendly relative response
             diff = due_date - datetime.utcnow()
@@ -120,13 +258,35 @@ def process_ai_reminder(user_id: int, question: str, db: Session):
                 mins = minutes % 60
                 time_str = f"in {hours}h {mins}m"
             
-            return f"I've set a reminder: '{content}' ({time_str})."
+            return f"I've set a reminder: '{content}' ({time_str}).", reminder
             
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"[WARN] Reminder extraction failed: {e}")
-        return None  # Fallback to normal chat
+        return None, None  # Fallback to normal chat
     
-    return None
+    return None, None
+
+def save_turn(db: Session, user_id: int, session_id: str, question: str, answer: str):
+    """
+    Commits the chat turn as a single unit of work.
+    Anything already staged on the session (new session, memory, reminder) goes
+    into the same commit as the two history rows. If nothing else is pending and
+    write-behind is enabled, the rows are group-committed with other requests instead.
+    """
+    rows = [
+        {"user_id": user_id, "session_id": session_id, "role": "user", "content": question},
+        {"user_id": user_id, "session_id": session_id, "role": "assistant", "content": answer},
+    ]
+    with timed("db_commit"):
+        if WRITE_BEHIND_ENABLED and not (db.new or db.dirty or db.deleted):
+            # Blocks until the batch holding these rows is committed
+            history_writer.submit(rows)
+        else:
+            db.add_all([ChatHistory(**row) for row in rows])
+            db.commit()
+    bump("history", session_id)
 
 # --- Endpoints ---
 @router.post("/sessions")
@@ -139,10 +299,15 @@ def create_session(data: CreateSessionRequest, db: Session = Depends(get_db)):
     db.add(new_session)
     db.commit()
     db.refresh(new_session)
+    bump("sessions", data.user_id)
     return new_session
 
 @router.get("/sessions/{user_id}", response_model=List[SessionResponse])
-def get_sessions(user_id: int, db: Session = Depends(get_db)):
+def get_sessions(user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Unchanged since the client's copy: 304 without querying
+    not_modified = conditional_get(request, response, "sessions", user_id)
+    if not_modified:
+        return not_modified
     sessions = db.query(ChatSession).filter(ChatSession.user_id == user_id).order_by(ChatSession.created_at.desc()).all()
     return sessions
 
@@ -152,72 +317,307 @@ def delete_session(session_id: str, db: Session = Depends(get_db)):
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
+    owner_id = session.user_id
     db.query(ChatHistory).filter(ChatHistory.session_id == session_id).delete()
+    # The archived frame stays in its segment until archive.compact_segments() reclaims it
+    db.query(ArchivedSession).filter(ArchivedSession.session_id == session_id).delete()
     db.delete(session)
     db.commit()
+    bump("sessions", owner_id)
+    bump("history", session_id)
     return {"message": "Session deleted"}
 
 @router.get("/history/{session_id}", response_model=List[ChatResponse])
-def get_history(session_id: str, db: Session = Depends(get_db)):
-    history = db.query(ChatHistory).filter(ChatHistory.session_id == session_id).order_by(ChatHistory.timestamp.asc()).all()
-    return history
+def get_history(session_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = conditional_get(request, response, "history", session_id)
+    if not_modified:
+        return not_modified
+
+    # Sessions moved to cold storage are reloaded into the hot table on access
+    if db.get(ArchivedSession, session_id) is not None:
+        restore_session(db, session_id)
+
+    # Read the stored (sealed) content as-is and decode the whole page in one batch
+    rows = (
+        db.query(ChatHistory.role, type_coerce(ChatHistory.content, Text).label("content"))
+        .filter(ChatHistory.session_id == session_id)
+        .order_by(ChatHistory.timestamp.asc())
+        .all()
+    )
+    contents = decode_many(row.content for row in rows)
+    return [{"role": row.role, "content": content} for row, content in zip(rows, contents)]
 
 @router.post("/chat")
-def chat(data: ChatRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def chat(
+    data: ChatRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    Runs one chat turn. Concurrent identical requests, keyed by the client's
+    Idempotency-Key header or else by (user_id, session_id, question), share a
+    single execution and a single stored turn.
+    """
+    # Fast 429 (with Retry-After) for a user over their rate. Checked per request,
+    # before coalescing, so duplicates cannot park threads without paying for it
+    chat_rate_limiter.check(data.user_id)
+
+    if idempotency_key:
+        key = ("idempotency", data.user_id, idempotency_key)
+        retain = IDEMPOTENCY_KEY_TTL_SECONDS
+    else:
+        # Only requests still in flight are coalesced; retries carry a key
+        key = ("question", data.user_id, data.session_id, data.question)
+        retain = 0
+
+    result, _shared = chat_flights.do(key, lambda: run_chat_turn(data, background_tasks, db), retain_seconds=retain)
+    return result
+
+def _bump_turn_versions(user_id: int, new_session: bool, new_memory: Optional[str], reminder: bool = False):
+    """Invalidate cached GETs for whatever the committed turn created besides history."""
+    if new_session:
+        bump("sessions", user_id)
+    if new_memory:
+        bump("memories", user_id)
+    if reminder:
+        bump("reminders", user_id)
+
+def _chunk_text(chunk) -> str:
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    # Some models stream a list of content parts
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def run_chat_turn(data: ChatRequest, background_tasks: BackgroundTasks, db: Session):
+    done = None
+    for event in iter_chat_turn(data.user_id, data.session_id, data.question, db, background_tasks.add_task):
+        done = event
+    return {"answer": done["answer"], "learned": done["learned"], "session_id": done["session_id"]}
+
+def iter_chat_turn(
+    user_id: int,
+    session_id: Optional[str],
+    question: str,
+    db: Session,
+    schedule,
+    user_name: Optional[str] = None,
+    stream: bool = False,
+):
+    """
+    Runs one chat turn as a generator of events, shared by POST /chat and the
+    WebSocket channel. With stream=True the answer is yielded as
+    {"type": "token"} events while the LLM generates it. After the turn is
+    committed come {"type": "learned"} / {"type": "reminder_set"} if the turn
+    created them, then a final {"type": "done"} event.
+    `schedule(fn)` runs follow-up work (RAG reloads) after the turn.
+    Callers check chat_rate_limiter first.
+    """
+    # Every write below is staged on `db` and committed once by save_turn().
+
     # 0. Ensure Session
-    session_id = data.session_id
-    if not session_id:
-        new_sess = ChatSession(id=str(uuid.uuid4()), user_id=data.user_id, title=data.question[:30] + "...")
+    new_session = not session_id
+    if new_session:
+        new_sess = ChatSession(id=str(uuid.uuid4()), user_id=user_id, title=question[:30] + "...")
         db.add(new_sess)
-        db.commit()
         session_id = new_sess.id
 
     # 1. Learning
-    new_memory = extract_learning(data.question)
+    new_memory = extract_learning(question)
     if new_memory:
-        db.add(UserMemory(user_id=data.user_id, content=new_memory))
-        db.commit()
-        # Trigger RAG reload in background
-        background_tasks.add_task(reload_rag)
+        db.add(UserMemory(user_id=user_id, content=new_memory))
+        # Trigger RAG reload in background (runs after the turn is committed)
+        defer_rag_reload(db, schedule)
 
     # 1.5 Check for Action (Reminder)
-    reminder_response = process_ai_reminder(data.user_id, data.question, db)
+    reminder_response, reminder = process_ai_reminder(user_id, question, db)
     if reminder_response:
         # If action taken, return early
         # Also trigger RAG reload because a new reminder exists
-        background_tasks.add_task(reload_rag)
-        
-        db.add(ChatHistory(user_id=data.user_id, session_id=session_id, role="user", content=data.question))
-        db.add(ChatHistory(user_id=data.user_id, session_id=session_id, role="assistant", content=reminder_response))
-        db.commit()
-        return {"answer": reminder_response, "learned": False, "session_id": session_id}
+        defer_rag_reload(db, schedule)
+
+        save_turn(db, user_id, session_id, question, reminder_response)
+        reminder_scheduler.schedule(reminder.id, reminder.user_id, reminder.content, reminder.due_date)
+        _bump_turn_versions(user_id, new_session, new_memory, reminder=True)
+        if new_memory:
+            yield {"type": "learned", "content": new_memory}
+        yield {"type": "reminder_set", "reminder": {
+            "id": reminder.id,
+            "content": reminder.content,
+            "due_date": reminder.due_date.isoformat() if reminder.due_date else None,
+        }}
+        yield {"type": "done", "answer": reminder_response, "learned": False, "session_id": session_id}
+        return
 
     # 2. RAG
     answer = ""
+
+    if index_store.shared_mode():
+        # Pick up index versions published by other workers
+        try:
+            refresh_rag()
+        except Exception as e:
+            print(f"[WARN] Could not load shared RAG index: {e}")
     
     if "chain" not in rag_components:
         # Check if already loading? For simplicity, just trigger if missing.
-        # We use background_tasks to load it so we don't block this request.
+        # We schedule it so we don't block this request.
         
-        background_tasks.add_task(reload_rag)
+        defer_rag_reload(db, schedule)
         answer = "I am initializing my memory system 🧠. Please ask me again in about 30 seconds!"
     
     else:
-        user = db.query(User).filter(User.id == data.user_id).first()
-        user_name = user.full_name if user and user.full_name else "User"
-        try:
-            response = rag_components["chain"].invoke({
-                "question": data.question, 
-                "user_name": user_name,
-                "user_id": data.user_id
-            })
-            answer = response.content
-        except Exception as e:
-            answer = f"I am having trouble accessing my memory right now. ({str(e)})"
+        if user_name is None:
+            profile = get_cached_profile(db, user_id)
+            user_name = profile["full_name"] if profile and profile["full_name"] else "User"
+        chain_input = {"question": question, "user_name": user_name, "user_id": user_id}
+        # Wait for an LLM slot (fair across users); raises AdmissionRejected when the queue is full
+        with llm_queue.slot(user_id):
+            try:
+                with timed("rag_chain"):
+                    if stream:
+                        parts = []
+                        for chunk in rag_components["chain"].stream(chain_input):
+                            text = _chunk_text(chunk)
+                            if text:
+                                parts.append(text)
+                                yield {"type": "token", "text": text}
+                        answer = "".join(parts)
+                    else:
+                        answer = rag_components["chain"].invoke(chain_input).content
+            except Exception as e:
+                answer = f"I am having trouble accessing my memory right now. ({str(e)})"
 
     # 3. Save
-    db.add(ChatHistory(user_id=data.user_id, session_id=session_id, role="user", content=data.question))
-    db.add(ChatHistory(user_id=data.user_id, session_id=session_id, role="assistant", content=answer))
-    db.commit()
+    save_turn(db, user_id, session_id, question, answer)
+    _bump_turn_versions(user_id, new_session, new_memory)
 
-    return {"answer": answer, "learned": new_memory is not None, "session_id": session_id}
+    if new_memory:
+        yield {"type": "learned", "content": new_memory}
+    yield {"type": "done", "answer": answer, "learned": new_memory is not None, "session_id": session_id}
+
+# --- WebSocket channel ---
+class ChatConnection:
+    """
+    State for one WebSocket, reused across its turns: the user's display name,
+    the bound session and a short summary of it. The session is checked once on
+    connect instead of on every message.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, session_id: Optional[str], title: Optional[str], user_name: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.session_id = session_id
+        self.title = title
+        self.user_name = user_name
+        self.turns = 0
+        # Turn events and pushed reminders come from different tasks
+        self._send_lock = asyncio.Lock()
+
+    def summary(self) -> dict:
+        return {"session_id": self.session_id, "title": self.title, "turns": self.turns}
+
+    async def send(self, event: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(event)
+
+    async def run_turn(self, question: str, message_id: Optional[str]):
+        db = SessionLocal()
+        # Follow-up work (RAG reloads) starts once the turn is committed, as BackgroundTasks would
+        scheduled = []
+        events = iter_chat_turn(
+            self.user_id, self.session_id, question, db, scheduled.append,
+            user_name=self.user_name, stream=True,
+        )
+        try:
+            chat_rate_limiter.check(self.user_id)
+            async for event in iterate_in_threadpool(events):
+                if event["type"] == "done":
+                    if self.session_id is None:
+                        self.session_id = event["session_id"]
+                        self.title = question[:30] + "..."
+                    self.turns += 1
+                    event["session"] = self.summary()
+                if message_id is not None:
+                    event["id"] = message_id
+                await self.send(event)
+        except AdmissionRejected as e:
+            await self.send({"type": "error", "status": 429, "detail": e.reason, "retry_after": e.retry_after, "id": message_id})
+        finally:
+            await run_in_threadpool(events.close)
+            await run_in_threadpool(db.close)
+        for fn in dict.fromkeys(scheduled):
+            threading.Thread(target=fn, daemon=True).start()
+
+    async def push_reminders(self, queue: asyncio.Queue):
+        while True:
+            reminder = await queue.get()
+            try:
+                await self.send({"type": "reminder", "reminder": reminder})
+            except (WebSocketDisconnect, RuntimeError):
+                return
+
+def _open_connection(user_id: int, session_id: Optional[str]):
+    """Validate the session and load the profile once; returns (title, user_name) or None."""
+    db = SessionLocal()
+    try:
+        title = None
+        if session_id:
+            session = db.get(ChatSession, session_id)
+            if session is None or session.user_id != user_id:
+                return None
+            title = session.title
+        profile = get_cached_profile(db, user_id)
+        if profile is None:
+            return None
+        return title, profile["full_name"] or "User"
+    finally:
+        db.close()
+
+@router.websocket("/ws/chat/{user_id}")
+async def chat_socket(websocket: WebSocket, user_id: int, session_id: Optional[str] = None):
+    """
+    Persistent chat channel bound to one user and (optionally) one session.
+
+    Client -> server: {"type": "message", "question": "...", "id": "<optional client id>"}
+    Server -> client:
+        {"type": "ready", "session": {...}}
+        {"type": "token", "text": "..."}                      streamed answer
+        {"type": "learned", "content": "..."}                 a memory was saved
+        {"type": "reminder_set", "reminder": {...}}           the turn created a reminder
+        {"type": "done", "answer": "...", "learned": bool, "session_id": "...", "session": {...}}
+        {"type": "reminder", "reminder": {...}}               a reminder became due
+        {"type": "error", "detail": "...", ["status": 429, "retry_after": s]}
+    Without session_id, the first message creates a session and the socket stays bound to it.
+    """
+    await websocket.accept()
+    opened = await run_in_threadpool(_open_connection, user_id, session_id)
+    if opened is None:
+        await websocket.send_json({"type": "error", "detail": "User or session not found"})
+        await websocket.close(code=1008)
+        return
+
+    title, user_name = opened
+    conn = ChatConnection(websocket, user_id, session_id, title, user_name)
+    queue = reminder_scheduler.subscribe(user_id, asyncio.get_running_loop())
+    pusher = asyncio.create_task(conn.push_reminders(queue))
+    try:
+        await conn.send({"type": "ready", "session": conn.summary()})
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                message = None
+            question = message.get("question") if isinstance(message, dict) and message.get("type") == "message" else None
+            if not isinstance(question, str) or not question.strip():
+                await conn.send({"type": "error", "detail": 'Expected {"type": "message", "question": "..."}'})
+                continue
+            # One turn at a time per socket; reminders keep flowing meanwhile
+            await conn.run_turn(question.strip(), message.get("id"))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pusher.cancel()
+        reminder_scheduler.unsubscribe(user_id, queue)
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import registry
+
+router = APIRouter()
+
+# --- Endpoints ---
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus scrape endpoint (per process: scrape every worker)."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
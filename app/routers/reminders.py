@@ -1,11 +1,17 @@
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import update, delete, not_
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+import asyncio
+import json
 
 from app.database import get_db, Reminder
+from app.core.scheduler import reminder_scheduler
+from app.core.versions import bump, conditional_get
 
 router = APIRouter()
 
@@ -24,10 +30,20 @@ class ReminderResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BatchToggleRequest(BaseModel):
+    ids: List[int]
+    is_completed: Optional[bool] = None  # None = flip each reminder
+
+class BatchDeleteRequest(BaseModel):
+    ids: List[int]
+
 # --- Endpoints ---
 
 @router.get("/reminders/{user_id}", response_model=List[ReminderResponse])
-def get_reminders(user_id: int, db: Session = Depends(get_db)):
+def get_reminders(user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = conditional_get(request, response, "reminders", user_id)
+    if not_modified:
+        return not_modified
     return db.query(Reminder).filter(Reminder.user_id == user_id).order_by(Reminder.created_at.desc()).all()
 
 @router.post("/reminders/{user_id}", response_model=ReminderResponse)
@@ -36,6 +52,8 @@ def create_reminder(user_id: int, data: ReminderCreate, db: Session = Depends(ge
     db.add(reminder)
     db.commit()
     db.refresh(reminder)
+    bump("reminders", user_id)
+    reminder_scheduler.schedule(reminder.id, user_id, reminder.content, reminder.due_date)
     return reminder
 
 @router.put("/reminders/{reminder_id}/toggle")
@@ -46,6 +64,11 @@ def toggle_reminder(reminder_id: int, db: Session = Depends(get_db)):
     
     reminder.is_completed = not reminder.is_completed
     db.commit()
+    bump("reminders", reminder.user_id)
+    if reminder.is_completed:
+        reminder_scheduler.cancel(reminder.id)
+    else:
+        reminder_scheduler.schedule(reminder.id, reminder.user_id, reminder.content, reminder.due_date)
     return {"message": "Toggled", "is_completed": reminder.is_completed}
 
 @router.delete("/reminders/{reminder_id}")
@@ -54,7 +77,80 @@ def delete_reminder(reminder_id: int, db: Session = Depends(get_db)):
     if not reminder:
         raise HTTPException(status_code=404, detail="Reminder not found")
     
+    owner_id = reminder.user_id
     db.delete(reminder)
     db.commit()
+    bump("reminders", owner_id)
+    reminder_scheduler.cancel(reminder_id)
     return {"message": "Deleted"}
 
+@router.post("/reminders/{user_id}/batch/toggle")
+def toggle_reminders(user_id: int, data: BatchToggleRequest, db: Session = Depends(get_db)):
+    """Toggle (or set) many of a user's reminders with one UPDATE and one commit."""
+    if not data.ids:
+        return {"message": "Toggled", "reminders": []}
+
+    new_value = not_(Reminder.is_completed) if data.is_completed is None else data.is_completed
+    rows = db.execute(
+        update(Reminder)
+        .where(Reminder.user_id == user_id, Reminder.id.in_(data.ids))
+        .values(is_completed=new_value)
+        .returning(Reminder.id, Reminder.content, Reminder.due_date, Reminder.is_completed)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    bump("reminders", user_id)
+
+    for row in rows:
+        if row.is_completed:
+            reminder_scheduler.cancel(row.id)
+        else:
+            reminder_scheduler.schedule(row.id, user_id, row.content, row.due_date)
+    return {
+        "message": "Toggled",
+        "reminders": [{"id": row.id, "is_completed": row.is_completed} for row in rows],
+    }
+
+@router.post("/reminders/{user_id}/batch/delete")
+def delete_reminders(user_id: int, data: BatchDeleteRequest, db: Session = Depends(get_db)):
+    """Delete many of a user's reminders with one DELETE and one commit."""
+    if not data.ids:
+        return {"message": "Deleted", "deleted": []}
+
+    deleted = db.execute(
+        delete(Reminder)
+        .where(Reminder.user_id == user_id, Reminder.id.in_(data.ids))
+        .returning(Reminder.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    bump("reminders", user_id)
+
+    reminder_scheduler.cancel_many(deleted)
+    return {"message": "Deleted", "deleted": deleted}
+
+@router.get("/reminders/{user_id}/stream")
+async def stream_reminders(user_id: int, request: Request):
+    """Server-Sent Events stream that pushes reminders to the client as they become due."""
+    queue = reminder_scheduler.subscribe(user_id, asyncio.get_running_loop())
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: reminder\ndata: {json.dumps(event)}\n\n"
+        finally:
+            reminder_scheduler.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
@@ -1,14 +1,29 @@
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+import json
+import os
+import uuid
 
-from app.database import get_db, User, UserMemory
-from app.routers.chat import reload_rag
+from app.database import get_db, SessionLocal, User, UserMemory
+from app.routers.chat import defer_rag_reload, index_memories
+from app.core.cache import TTLCache
+from app.core.profiles import get_cached_profile, invalidate_profile
+from app.core.versions import bump, conditional_get
 
 router = APIRouter()
 
+# --- Streaming import settings ---
+IMPORT_BATCH_SIZE = int(os.getenv("MEMORY_IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_LINE_BYTES = 64 * 1024
+# (user_id, import_id) -> progress, so clients can poll while a large upload is running.
+# Keyed by owner too: a client-chosen import_id never reaches another user's import.
+import_progress = TTLCache(maxsize=1000, ttl=3600)
+
 # --- Schemas ---
 class ProfileUpdate(BaseModel):
     full_name: str
@@ -20,10 +35,10 @@ class MemoryResponse(BaseModel):
 # --- Endpoints ---
 @router.get("/me/{user_id}")
 def get_profile(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    profile = get_cached_profile(db, user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"username": user.username, "full_name": user.full_name}
+    return {"username": profile["username"], "full_name": profile["full_name"]}
 
 @router.put("/me/{user_id}")
 def update_profile(user_id: int, data: ProfileUpdate, db: Session = Depends(get_db)):
@@ -33,10 +48,14 @@ def update_profile(user_id: int, data: ProfileUpdate, db: Session = Depends(get_
     
     user.full_name = data.full_name
     db.commit()
+    invalidate_profile(user_id)
     return {"message": "Profile updated", "full_name": user.full_name}
 
 @router.get("/memories/{user_id}", response_model=List[MemoryResponse])
-def get_memories(user_id: int, db: Session = Depends(get_db)):
+def get_memories(user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = conditional_get(request, response, "memories", user_id)
+    if not_modified:
+        return not_modified
     memories = db.query(UserMemory).filter(UserMemory.user_id == user_id).all()
     return memories
 
@@ -46,12 +65,38 @@ def delete_memory(memory_id: int, background_tasks: BackgroundTasks, db: Session
     if not memory:
         raise HTTPException(status_code=404, detail="Memory not found")
     
+    owner_id = memory.user_id
     db.delete(memory)
+    # Trigger RAG reload in background (a queued job when JOB_QUEUE is on)
+    defer_rag_reload(db, background_tasks.add_task)
     db.commit()
-    # Trigger RAG reload in background
-    background_tasks.add_task(reload_rag)
+    bump("memories", owner_id)
     return {"message": "Memory deleted"}
 
+class BatchDeleteMemoriesRequest(BaseModel):
+    ids: List[int]
+
+@router.post("/memories/{user_id}/batch/delete")
+def delete_memories(user_id: int, data: BatchDeleteMemoriesRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Delete many of a user's memories with one DELETE, one commit and at most one RAG reload."""
+    if not data.ids:
+        return {"message": "Memories deleted", "deleted": []}
+
+    deleted = db.execute(
+        delete(UserMemory)
+        .where(UserMemory.user_id == user_id, UserMemory.id.in_(data.ids))
+        .returning(UserMemory.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    if deleted:
+        # Trigger RAG reload in background
+        defer_rag_reload(db, background_tasks.add_task)
+    db.commit()
+
+    if deleted:
+        bump("memories", user_id)
+    return {"message": "Memories deleted", "deleted": deleted}
+
 class CreateMemoryRequest(BaseModel):
     items: List[str]
 
@@ -61,7 +106,107 @@ def add_memories(user_id: int, data: CreateMemoryRequest, background_tasks: Back
     for content in data.items:
         if content and content.strip():
             db.add(UserMemory(user_id=user_id, content=content.strip()))
-    db.commit()
     # Trigger RAG reload in background
-    background_tasks.add_task(reload_rag)
+    defer_rag_reload(db, background_tasks.add_task)
+    db.commit()
+    bump("memories", user_id)
     return {"message": "Memories added"}
+
+# --- Streaming import ---
+def _parse_import_line(line: bytes) -> Optional[str]:
+    """An NDJSON line is either a JSON string or an object with a "content" field."""
+    item = json.loads(line)
+    content = item.get("content") if isinstance(item, dict) else item
+    if not isinstance(content, str):
+        raise ValueError("Expected a string or an object with a 'content' string")
+    content = content.strip()
+    return content or None
+
+def _insert_memory_batch(user_id: int, contents: List[str]):
+    """Insert one batch with a single executemany; returns [(id, content), ...]."""
+    db = SessionLocal()
+    try:
+        ids = db.execute(
+            insert(UserMemory).returning(UserMemory.id, sort_by_parameter_order=True),
+            [{"user_id": user_id, "content": content} for content in contents],
+        ).scalars().all()
+        db.commit()
+        bump("memories", user_id)
+        return list(zip(ids, contents))
+    finally:
+        db.close()
+
+@router.post("/memories/{user_id}/import")
+async def import_memories(user_id: int, request: Request, background_tasks: BackgroundTasks, import_id: Optional[str] = None):
+    """
+    Streaming bulk import. The body is NDJSON (one memory per line, as a JSON
+    string or {"content": ...}) and is parsed as it arrives. Every
+    MEMORY_IMPORT_BATCH_SIZE lines are inserted with one executemany and
+    embedded into the index, so memory use is bounded by the batch size, not
+    the upload size. Progress can be polled at GET /memories/{user_id}/import/{import_id}.
+    """
+    import_id = import_id or uuid.uuid4().hex
+    progress = {"import_id": import_id, "status": "running", "received": 0, "inserted": 0, "indexed": 0, "errors": 0}
+    import_progress.set((user_id, import_id), progress)
+
+    needs_reload = False
+    batch: List[str] = []
+    buffer = b""
+
+    async def flush():
+        nonlocal needs_reload, batch
+        rows = await run_in_threadpool(_insert_memory_batch, user_id, batch)
+        progress["inserted"] += len(rows)
+        batch = []
+        if not needs_reload:
+            try:
+                if await run_in_threadpool(index_memories, user_id, rows):
+                    progress["indexed"] += len(rows)
+                else:
+                    needs_reload = True
+            except Exception as e:
+                print(f"[WARN] Incremental indexing failed, falling back to a full reload: {e}")
+                needs_reload = True
+
+    def take(line: bytes):
+        line = line.strip()
+        if not line:
+            return
+        progress["received"] += 1
+        try:
+            content = _parse_import_line(line)
+        except ValueError:  # json.JSONDecodeError is a ValueError
+            progress["errors"] += 1
+            return
+        if content:
+            batch.append(content)
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            if len(buffer) > IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail="Import line too long")
+            for line in lines:
+                take(line)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    await flush()
+        take(buffer)
+        if batch:
+            await flush()
+    except Exception:
+        progress["status"] = "failed"
+        raise
+
+    if needs_reload and progress["inserted"]:
+        # Trigger RAG reload in background
+        await run_in_threadpool(defer_rag_reload, None, background_tasks.add_task)
+    progress["status"] = "done"
+    return progress
+
+@router.get("/memories/{user_id}/import/{import_id}")
+def get_import_progress(user_id: int, import_id: str):
+    progress = import_progress.get((user_id, import_id))
+    if not progress:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return progress
@@ -0,0 +1,169 @@
+"""
+Background worker for the durable job queue (app/core/jobs.py).
+
+    JOB_QUEUE=1 RAG_INDEX_MODE=shared python -m app.worker [--concurrency 2]
+
+Each of JOB_WORKER_CONCURRENCY threads claims up to JOB_CLAIM_BATCH ready jobs
+at a time. Claimed jobs of the same kind are grouped: a batch handler gets all
+of them in one call (ten queued index rebuilds run as one). Leases are renewed
+while jobs run, failures are retried with backoff, and SIGINT/SIGTERM let the
+running jobs finish before exiting.
+
+Index rebuilds publish a new shared index version, which the API workers pick
+up on their next request. That is why the queue handles rebuilds only in
+RAG_INDEX_MODE=shared. Memory consolidation also needs Redis for the version
+counters (see app.core.consolidation.out_of_process_ready); without it the API
+keeps running consolidation in-process.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, NamedTuple
+
+from app.database import init_db
+from app.core import jobs
+from app.core.consolidation import CONSOLIDATION_INTERVAL_HOURS, out_of_process_ready
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "1"))
+JOB_CLAIM_BATCH = int(os.getenv("JOB_CLAIM_BATCH", "20"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+
+class Handler(NamedTuple):
+    fn: Callable
+    batch: bool  # True: fn(list of payloads) once per group; False: fn(payload) per job
+
+
+HANDLERS: Dict[str, Handler] = {}
+
+
+def job_handler(kind: str, batch: bool = False):
+    def register(fn):
+        HANDLERS[kind] = Handler(fn, batch)
+        return fn
+    return register
+
+
+# --- Handlers ---
+@job_handler("reload_rag", batch=True)
+def rebuild_index(payloads: List[dict]):
+    from app.rag import index_store
+    from app.routers.chat import _rebuild_shared_index
+
+    if not index_store.shared_mode():
+        print("[WARN] reload_rag jobs need RAG_INDEX_MODE=shared; the API rebuilds its own index otherwise.")
+        return
+    # Raises on failure so the job is retried; returns False if another process is already building
+    _rebuild_shared_index()
+
+
+@job_handler("consolidate_memories")
+def consolidate_memories(payload: dict):
+    from app.core.consolidation import consolidate_all
+
+    if not out_of_process_ready():
+        print("[WARN] consolidate_memories jobs need RAG_INDEX_MODE=shared and REDIS_URL; skipped.")
+        return
+    consolidate_all(payload.get("user_id"))
+
+
+# --- Worker ---
+class Worker:
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._in_flight: Dict[str, List[int]] = {}  # worker thread id -> leased job ids
+        self._lock = threading.Lock()
+
+    def stop(self, *_args):
+        print("[INFO] Worker stopping after the current jobs...")
+        self._stop.set()
+
+    def run(self):
+        threads = [
+            threading.Thread(target=self._loop, args=(f"{self.name}-{i}",), name=f"job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        print(f"[SUCCESS] Job worker {self.name} running with {self.concurrency} thread(s)")
+
+        next_prune = 0.0
+        consolidate = CONSOLIDATION_INTERVAL_HOURS > 0 and out_of_process_ready()
+        if CONSOLIDATION_INTERVAL_HOURS > 0 and not consolidate:
+            print("[WARN] Memory consolidation needs RAG_INDEX_MODE=shared and REDIS_URL in the worker; "
+                  "the API runs it in-process instead.")
+        next_consolidation = time.monotonic() + CONSOLIDATION_INTERVAL_HOURS * 3600
+        # Renew leases well before they run out
+        while not self._stop.wait(jobs.JOB_LEASE_SECONDS / 3):
+            with self._lock:
+                leased = list(self._in_flight.items())
+            for worker_id, job_ids in leased:
+                jobs.renew(worker_id, job_ids)
+
+            now = time.monotonic()
+            if now >= next_prune:
+                jobs.prune_finished()
+                next_prune = now + 3600
+            if consolidate and now >= next_consolidation:
+                jobs.submit_job("consolidate_memories", dedupe_key="consolidate_memories")
+                next_consolidation = now + CONSOLIDATION_INTERVAL_HOURS * 3600
+
+        for thread in threads:
+            thread.join()
+
+    def _loop(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                claimed = jobs.claim(worker_id, JOB_CLAIM_BATCH, kinds=list(HANDLERS))
+            except Exception as e:
+                print(f"[ERROR] Claiming jobs failed: {e}")
+                self._stop.wait(JOB_POLL_SECONDS * 5)
+                continue
+            if not claimed:
+                self._stop.wait(JOB_POLL_SECONDS)
+                continue
+
+            with self._lock:
+                self._in_flight[worker_id] = [job.id for job in claimed]
+            try:
+                groups: Dict[str, list] = {}
+                for job in claimed:
+                    groups.setdefault(job.kind, []).append(job)
+                for kind, group in groups.items():
+                    self._run_group(worker_id, HANDLERS[kind], group)
+            finally:
+                with self._lock:
+                    self._in_flight.pop(worker_id, None)
+
+    def _run_group(self, worker_id: str, handler: Handler, group: list):
+        batches = [group] if handler.batch else [[job] for job in group]
+        for batch in batches:
+            payloads = [json.loads(job.payload or "{}") for job in batch]
+            started = time.perf_counter()
+            try:
+                handler.fn(payloads if handler.batch else payloads[0])
+            except Exception as e:
+                print(f"[WARN] Job {batch[0].kind} {[job.id for job in batch]} failed: {e}")
+                jobs.fail(worker_id, batch, f"{e}\n{traceback.format_exc()}")
+                continue
+            jobs.complete(worker_id, [job.id for job in batch])
+            print(f"[INFO] Job {batch[0].kind} x{len(batch)} done in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="RepliMate background job worker")
+    arg_parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    args = arg_parser.parse_args()
+
+    init_db()
+    worker = Worker(args.concurrency)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    worker.run()
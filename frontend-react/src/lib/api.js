@@ -1,7 +1,7 @@
 
 import axios from 'axios';
 
-const API_URL = import.meta.env.VITE_API_URL || "http://127.0.0.1:8000";
+export const API_URL = import.meta.env.VITE_API_URL || "http://127.0.0.1:8000";
 
 const api = axios.create({
     baseURL: API_URL,
@@ -11,3 +11,43 @@ const api = axios.create({
 });
 
 export default api;
+
+// Idempotency-Key for one chat message. crypto.randomUUID only exists in secure
+// contexts (https/localhost), so plain-http deployments get a random fallback.
+export function newIdempotencyKey() {
+    if (globalThis.crypto?.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+// Persistent chat channel (see /ws/chat/{user_id} in app/routers/chat.py).
+// handlers: { onReady, onToken, onDone, onLearned, onReminderSet, onReminder, onError, onClose }
+export function openChatSocket(userId, sessionId, handlers = {}) {
+    const url = new URL(`/ws/chat/${userId}`, API_URL.replace(/^http/, "ws"));
+    if (sessionId) url.searchParams.set("session_id", sessionId);
+    const socket = new WebSocket(url);
+
+    const dispatch = {
+        ready: handlers.onReady,
+        token: handlers.onToken,
+        done: handlers.onDone,
+        learned: handlers.onLearned,
+        reminder_set: handlers.onReminderSet,
+        reminder: handlers.onReminder,
+        error: handlers.onError,
+    };
+    socket.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+        dispatch[event.type]?.(event);
+    };
+    socket.onclose = (event) => handlers.onClose?.(event);
+
+    return {
+        send(question, id = newIdempotencyKey()) {
+            socket.send(JSON.stringify({ type: "message", question, id }));
+            return id;
+        },
+        close() {
+            socket.close();
+        },
+    };
+}
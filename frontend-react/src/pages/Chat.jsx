@@ -1,6 +1,6 @@
 
 import React, { useState, useEffect, useRef } from 'react';
-import api from '../lib/api';
+import api, { newIdempotencyKey } from '../lib/api';
 import { useNavigate, useParams } from 'react-router-dom';
 import Sidebar from '../components/Sidebar';
 import { Send, Mic } from 'lucide-react';
@@ -75,23 +75,42 @@ const Chat = () => {
         }, 100);
     };
 
+    // Network errors and 5xx are retried with the message's own key
+    const postChat = async (payload, idempotencyKey, retries = 2) => {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await api.post("/chat", payload, {
+                    headers: { "Idempotency-Key": idempotencyKey }
+                });
+            } catch (err) {
+                const retryable = !err.response || err.response.status >= 500;
+                if (!retryable || attempt >= retries) throw err;
+                await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+            }
+        }
+    };
+
     const handleSend = async () => {
         if (!input.trim() || loading) return;
         const userMsg = input.trim();
         setInput('');
         setLoading(true);
 
+        // One key per composed message, kept with it: retries of this message reuse it,
+        // so the server runs the turn once however many times the POST is sent
+        const idempotencyKey = newIdempotencyKey();
+
         // Optimistic UI
-        const tempMsg = { role: 'user', content: userMsg, isNew: false };
+        const tempMsg = { role: 'user', content: userMsg, isNew: false, idempotencyKey };
         setMessages(prev => [...prev, tempMsg]);
         scrollToBottom();
 
         try {
-            const res = await api.post("/chat", {
+            const res = await postChat({
                 user_id: userId,
                 question: userMsg,
                 session_id: routeSessionId || null // Use route ID if exists
-            });
+            }, tempMsg.idempotencyKey);
 
             const { answer, session_id } = res.data;
 
@@ -1,6 +1,6 @@
 
-import React, { useState, useEffect, useRef } from 'react';
-import api from '../lib/api';
+import React, { useState, useEffect } from 'react';
+import api, { API_URL } from '../lib/api';
 import Sidebar from '../components/Sidebar';
 import { useNavigate } from 'react-router-dom';
 import { Plus, Trash2, CheckCircle, Circle, Bell, Clock } from 'lucide-react';
@@ -14,13 +14,6 @@ const Reminders = () => {
     const [loading, setLoading] = useState(false);
     const [toast, setToast] = useState(null); // In-App Notification State
 
-    // Ref to avoid stale closures in setInterval
-    const remindersRef = useRef([]);
-
-    useEffect(() => {
-        remindersRef.current = reminders;
-    }, [reminders]);
-
     useEffect(() => {
         if (!userId) {
             navigate("/auth");
@@ -33,9 +26,13 @@ const Reminders = () => {
             Notification.requestPermission();
         }
 
-        // Check for due reminders every 10 seconds
-        const interval = setInterval(checkReminders, 10000);
-        return () => clearInterval(interval);
+        // The server pushes reminders as they become due (no polling)
+        const events = new EventSource(`${API_URL}/reminders/${userId}/stream`);
+        events.addEventListener("reminder", (e) => {
+            const r = JSON.parse(e.data);
+            showNotification(r.content);
+        });
+        return () => events.close();
     }, [userId]);
 
     const loadReminders = async () => {
@@ -53,26 +50,6 @@ const Reminders = () => {
         }
     };
 
-    const checkReminders = () => {
-        const now = new Date();
-        remindersRef.current.forEach(r => {
-            if (!r.is_completed && r.due_date) {
-                // Backend sends naive UTC string (e.g., "2023-10-27T14:30:00")
-                // We append 'Z' to force browser to treat it as UTC, then convert to local
-                const utcDateString = r.due_date.endsWith("Z") ? r.due_date : r.due_date + "Z";
-                const due = new Date(utcDateString);
-
-                const diffSeconds = (now - due) / 1000;
-
-                // Trigger if due in the last 2 minutes (0 to 120s ago)
-                // This covers us if the interval missed the exact second.
-                if (diffSeconds >= 0 && diffSeconds < 120) {
-                    showNotification(r.content);
-                }
-            }
-        });
-    };
-
     const showNotification = async (text) => {
         // ALWAYS show in-app toast (guaranteed visibility)
         setToast(text);
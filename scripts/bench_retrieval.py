@@ -0,0 +1,321 @@
+"""
+Retrieval benchmark: recall@k and latency of the app/rag pipeline on synthetic corpora.
+
+For each corpus size, generates memories for --users synthetic users plus one
+global document, with one labeled query per sampled memory. The corpus goes
+through the same stages as the app:
+
+    app.rag.loader.iter_memory_batches        (rows read back from a scratch SQLite DB)
+    app.rag.vectorstore.create_vector_store_from_batches
+    app.rag.chain.retrieve_documents          (k=3 user + k=2 global, as in /chat)
+    app.rag.retriever.create_retriever        (k=2, unfiltered)
+
+and, with --strategies, both index strategies: "local" (in-process FAISS) and
+"shared" (published to disk, vectors mmapped, see app/rag/index_store.py).
+Embeddings come from a local hashing embedder, so no API key or network is
+needed and runs are repeatable.
+
+Usage:
+    python scripts/bench_retrieval.py [--sizes 1000,10000,100000] [--users 100]
+        [--queries 200] [--strategies local,shared] [--out report.json]
+
+Reports build time, memory footprint (total and process-private resident growth),
+query p50/p99 and recall@k as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# --- Local embedder ---
+def make_hashing_embeddings(dim: int):
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+
+    token_re = re.compile(r"[a-z0-9]+")
+
+    class HashingEmbeddings(Embeddings):
+        """Signed feature hashing of word unigrams, L2-normalised."""
+
+        def _embed(self, text):
+            vec = np.zeros(dim, dtype=np.float32)
+            for token in token_re.findall(text.lower()):
+                h = zlib.crc32(token.encode())
+                vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+            norm = np.linalg.norm(vec)
+            return (vec / norm if norm else vec).tolist()
+
+        def embed_documents(self, texts):
+            return [self._embed(t) for t in texts]
+
+        def embed_query(self, text):
+            return self._embed(text)
+
+    return HashingEmbeddings()
+
+
+# --- Synthetic corpus ---
+def make_vocabulary(rng: random.Random, size: int = 5000):
+    syllables = ["ka", "lo", "mi", "ra", "tu", "ne", "so", "vi", "da", "pe", "zu", "ho", "gi", "ba", "fe", "yo"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_corpus(rng: random.Random, vocab, size: int, users: int, queries: int):
+    """
+    Returns (memories, labeled) where memories is [(user_id, content)] and labeled
+    is [(user_id, query, expected_content)]. Each memory is a unique fact for its
+    user; its query reuses two of the fact's subject words and one value word.
+    """
+    memories = []
+    facts = []
+    for i in range(size):
+        user_id = i % users + 1
+        subject = rng.sample(vocab, 3)
+        value = rng.sample(vocab, 3)
+        content = f"Memory {i // users}: the {' '.join(subject)} is {' '.join(value)}."
+        memories.append((user_id, content))
+        facts.append((user_id, subject, value, content))
+
+    labeled = []
+    for user_id, subject, value, content in rng.sample(facts, min(queries, len(facts))):
+        words = rng.sample(subject, 2) + [rng.choice(value)]
+        labeled.append((user_id, f"What about the {' '.join(words)}?", content))
+    return memories, labeled
+
+
+# --- Measurements ---
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # Peak, not current, where /proc is unavailable (kilobytes on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:
+            return None
+
+
+def private_bytes():
+    """Anonymous (process-private) resident memory. Pages of an mmapped index are
+    file-backed and shared by every worker, so they count in rss_bytes() but not here."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def growth(before, after):
+    return (after - before) if before is not None and after is not None else None
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def measure_queries(vectorstore, labeled):
+    from app.rag.chain import retrieve_documents
+    from app.rag.retriever import create_retriever
+
+    retriever = create_retriever(vectorstore)
+    chat_times, chat_hits, global_hits = [], 0, 0
+    retriever_times, retriever_hits = [], 0
+
+    for user_id, query, expected in labeled:
+        start = time.perf_counter()
+        docs_user, docs_global = retrieve_documents(vectorstore, query, user_id)
+        chat_times.append(time.perf_counter() - start)
+        chat_hits += any(doc.page_content == expected for doc in docs_user)
+        global_hits += bool(docs_global)
+
+        start = time.perf_counter()
+        docs = retriever.invoke(query)
+        retriever_times.append(time.perf_counter() - start)
+        retriever_hits += any(doc.page_content == expected for doc in docs)
+
+    n = max(1, len(labeled))
+    return {
+        "retrieve_documents": {
+            "k_user": 3, "k_global": 2,
+            "recall_at_k": round(chat_hits / n, 4),
+            "global_hit_rate": round(global_hits / n, 4),
+            "p50_ms": ms(percentile(chat_times, 50)),
+            "p99_ms": ms(percentile(chat_times, 99)),
+            "mean_ms": ms(statistics.mean(chat_times)) if chat_times else None,
+        },
+        "create_retriever": {
+            "k": 2,
+            "recall_at_k": round(retriever_hits / n, 4),
+            "p50_ms": ms(percentile(retriever_times, 50)),
+            "p99_ms": ms(percentile(retriever_times, 99)),
+            "mean_ms": ms(statistics.mean(retriever_times)) if retriever_times else None,
+        },
+    }
+
+
+def load_memories(memories):
+    """Replace the scratch database's memories with the synthetic corpus."""
+    from sqlalchemy import delete, insert
+
+    from app.database import SessionLocal, UserMemory
+
+    db = SessionLocal()
+    try:
+        db.execute(delete(UserMemory))
+        for start in range(0, len(memories), 10_000):
+            chunk = memories[start:start + 10_000]
+            db.execute(insert(UserMemory), [{"user_id": u, "content": c} for u, c in chunk])
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_size(size, args, rng, vocab):
+    from app.rag import index_store
+    from app.rag.loader import iter_memory_batches
+    from app.rag.vectorstore import create_vector_store_from_batches
+
+    memories, labeled = make_corpus(rng, vocab, size, args.users, args.queries)
+    start = time.perf_counter()
+    load_memories(memories)
+    result = {"documents": size + 1, "users": args.users, "queries": len(labeled),
+              "db_insert_seconds": round(time.perf_counter() - start, 3)}
+    del memories
+
+    # 1. Loader on its own (DB read + Document construction)
+    start = time.perf_counter()
+    loaded = sum(len(batch) for batch in iter_memory_batches())
+    result["load_seconds"] = round(time.perf_counter() - start, 3)
+    result["loaded_documents"] = loaded
+
+    # 2. Build (load + embed + index), as refresh_rag does it
+    rss_before, private_before = rss_bytes(), private_bytes()
+    start = time.perf_counter()
+    vectorstore = create_vector_store_from_batches(iter_memory_batches())
+    result["build_seconds"] = round(time.perf_counter() - start, 3)
+    rss_after, private_after = rss_bytes(), private_bytes()
+
+    result["strategies"] = {}
+    for strategy in args.strategies:
+        if strategy == "local":
+            store = vectorstore
+            stats = {
+                "index_bytes": store.index.ntotal * store.index.d * 4,
+                "rss_growth_bytes": growth(rss_before, rss_after),
+                "private_growth_bytes": growth(private_before, private_after),
+            }
+        elif strategy == "shared":
+            start = time.perf_counter()
+            version = index_store.publish(vectorstore)
+            publish_seconds = time.perf_counter() - start
+            rss_before_load, private_before_load = rss_bytes(), private_bytes()
+            start = time.perf_counter()
+            store = index_store.load_version(version, vectorstore.embeddings)
+            stats = {
+                "publish_seconds": round(publish_seconds, 3),
+                "load_seconds": round(time.perf_counter() - start, 3),
+                "index_bytes": os.path.getsize(os.path.join(index_store.INDEX_DIR, version, "index.faiss")),
+                "docs_bytes": os.path.getsize(os.path.join(index_store.INDEX_DIR, version, "docs.sqlite")),
+            }
+        else:
+            raise SystemExit(f"[ERROR] Unknown strategy: {strategy}")
+
+        stats.update(measure_queries(store, labeled))
+        if strategy == "shared":
+            # Includes the shared page cache the queries touched; private growth is the per-worker cost
+            stats["rss_growth_bytes"] = growth(rss_before_load, rss_bytes())
+            stats["private_growth_bytes"] = growth(private_before_load, private_bytes())
+        result["strategies"][strategy] = stats
+        print(f"[INFO] size={size} strategy={strategy} "
+              f"recall@3={stats['retrieve_documents']['recall_at_k']} "
+              f"p99={stats['retrieve_documents']['p99_ms']}ms", file=sys.stderr)
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Comma-separated corpus sizes, e.g. 1000,10000,100000,1000000")
+    arg_parser.add_argument("--users", type=int, default=100)
+    arg_parser.add_argument("--queries", type=int, default=200)
+    arg_parser.add_argument("--dim", type=int, default=256, help="Hashing embedder dimension")
+    arg_parser.add_argument("--strategies", default="local,shared")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--encrypt", action="store_true", help="Keep storage encryption on (slower inserts/loads)")
+    arg_parser.add_argument("--out", default=None, help="Also write the JSON report to this file")
+    args = arg_parser.parse_args()
+    args.strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    sizes = [int(float(s)) for s in args.sizes.split(",") if s.strip()]
+    out_path = os.path.abspath(args.out) if args.out else None
+
+    # Everything the app writes goes to a scratch directory: database, index, storage key
+    workdir = tempfile.mkdtemp(prefix="bench-retrieval-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["RAG_INDEX_DIR"] = os.path.join(workdir, "index")
+    os.environ["STORAGE_KEY_FILE"] = os.path.join(workdir, "storage.key")
+    if not args.encrypt:
+        os.environ["STORAGE_ENCRYPTION"] = "0"
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+
+    try:
+        rng = random.Random(args.seed)
+        vocab = make_vocabulary(rng)
+
+        # The loader reads the global document from data/user_memory.txt (relative to cwd)
+        os.makedirs("data", exist_ok=True)
+        with open(os.path.join("data", "user_memory.txt"), "w", encoding="utf-8") as f:
+            f.write("Global story: " + " ".join(rng.sample(vocab, 50)))
+
+        from app.database import init_db
+        from app.rag import vectorstore as vs
+
+        init_db()
+        vs._embeddings = vs.TimedEmbeddings(make_hashing_embeddings(args.dim))
+
+        report = {
+            "benchmark": "retrieval",
+            "embedder": f"hashing-{args.dim}",
+            "seed": args.seed,
+            "encrypted": args.encrypt,
+            "results": [run_size(size, args, rng, vocab) for size in sizes],
+        }
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Startup-time benchmark: how long does `import app.main` take in a fresh interpreter?
+
+Runs the import in N clean subprocesses with `-X importtime`, then reports the
+median wall time, the slowest imports and any heavy RAG/LLM modules
+that were loaded eagerly. Prints JSON so runs can be compared over time.
+
+Usage:
+    python scripts/bench_startup.py [--runs 5] [--budget-ms 1500]
+
+Exits non-zero if the median exceeds --budget-ms or a heavy module is imported.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Must only be imported on first use (see app/routers/chat.py)
+HEAVY_PREFIXES = ("langchain", "langchain_core", "langchain_community", "langchain_google_genai", "faiss", "google.genai")
+
+PROBE = (
+    "import sys, json; import app.main; "
+    "print(json.dumps(sorted(m for m in sys.modules if m.startswith({prefixes!r}))))"
+)
+
+
+def run_once():
+    env = dict(os.environ)
+    # Never touch a real database from the benchmark
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(prefixes=HEAVY_PREFIXES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    # stderr lines: "import time: self [us] | cumulative | imported package"
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _self_us, cumulative_us, raw_name = line.replace("import time:", "|", 1).split("|")
+        # Nested imports are indented by two extra spaces per level; keep the
+        # top level and its direct children (what app.main itself pulls in)
+        if len(raw_name) - len(raw_name.lstrip()) in (1, 3):
+            imports.append((raw_name.strip(), int(cumulative_us) / 1000))
+
+    heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+    return wall_ms, imports, heavy
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--budget-ms", type=float, default=None)
+    args = arg_parser.parse_args()
+
+    walls = []
+    import_ms = {}
+    heavy = []
+    for _ in range(args.runs):
+        wall_ms, imports, heavy = run_once()
+        walls.append(wall_ms)
+        for name, ms in imports:
+            import_ms.setdefault(name, []).append(ms)
+
+    slowest = sorted(((name, statistics.median(v)) for name, v in import_ms.items()), key=lambda x: -x[1])[:10]
+    report = {
+        "runs": args.runs,
+        "wall_ms_median": round(statistics.median(walls), 1),
+        "wall_ms_min": round(min(walls), 1),
+        "app_main_import_ms": round(statistics.median(import_ms.get("app.main", [0])), 1),
+        "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest},
+        "eager_heavy_modules": heavy,
+    }
+    print(json.dumps(report, indent=2))
+
+    if heavy:
+        print(f"[ERROR] Heavy modules imported at startup: {', '.join(heavy[:5])}", file=sys.stderr)
+        sys.exit(1)
+    if args.budget_ms is not None and report["wall_ms_median"] > args.budget_ms:
+        print(f"[ERROR] Startup {report['wall_ms_median']}ms exceeds budget {args.budget_ms}ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Re-encrypts stored chat history, memories, consolidation provenance and
+archived sessions with the current primary storage key, and publishes a fresh
+shared RAG index (RAG_INDEX_MODE=shared) whose docs.sqlite uses it too.
+
+Usage:
+    1. Prepend the new key: STORAGE_ENCRYPTION_KEYS="<new>,<old>", and restart
+       the app (and the archiver) so new writes use it
+    2. python scripts/rotate_storage_key.py
+    3. Drop the old key once this has finished.
+
+Legacy plaintext rows are encrypted on the way. Archive segment frames
+(app/core/archive.py) are copied re-sealed into new segments; the old segments
+are deleted by this run or, if written within ARCHIVE_COMPACT_GRACE_SECONDS,
+by the next `python -m app.core.archive --compact`. Nothing points at them
+after this script, so the old key is no longer needed to read them. Older
+shared index versions still use the old key until they are pruned
+(RAG_INDEX_KEEP_VERSIONS), so don't roll back to one after step 3.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import Text, type_coerce, update
+
+from app.database import SessionLocal, ChatHistory, UserMemory, MemoryProvenance
+from app.core.archive import compact_segments
+from app.core.encryption import reencode_content
+
+BATCH_SIZE = 500
+
+
+def rotate_table(model, column: str = "content"):
+    raw_content = type_coerce(getattr(model, column), Text)
+    db = SessionLocal()
+    last_id = 0
+    total = 0
+    try:
+        while True:
+            rows = (
+                db.query(model.id, raw_content.label("content"))
+                .filter(model.id > last_id)
+                .order_by(model.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                db.execute(
+                    update(model.__table__)
+                    .where(model.__table__.c.id == row.id)
+                    .values({column: type_coerce(reencode_content(row.content), Text)})
+                )
+            db.commit()
+            last_id = rows[-1].id
+            total += len(rows)
+            print(f"[INFO] {model.__tablename__}: {total} rows re-encrypted")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rotate_table(ChatHistory)
+    rotate_table(UserMemory)
+    rotate_table(MemoryProvenance, "source_content")
+    compact_segments(reseal=True)
+
+    from app.rag import index_store
+    if index_store.shared_mode():
+        # Published versions store sealed document text; build one with the new key
+        from app.routers.chat import _rebuild_shared_index
+        _rebuild_shared_index()
+        print("[INFO] Published a shared RAG index sealed with the new key")
+    print("[SUCCESS] Storage key rotation complete.")